@@ -0,0 +1,63 @@
+import asyncio
+import argparse
+
+from opendr.simulator import Simulator
+
+# =====================================================================
+def Run():
+    parser = argparse.ArgumentParser(prog="openDR-Simulator")
+
+    # Network Option
+    parser.set_defaults(tcp='127.0.0.1', port=8010)
+    parser.add_argument("-T", "--tcp", dest="tcp", help="TCP/IP address to listen on")
+    parser.add_argument("-P", "--port", dest="port", help="TCP/IP port")
+
+    parser.add_argument(
+        "-m",
+        "--model",
+        dest="model",
+        default="DR-22WL",
+        choices=["DR-22WL", "DR-44WL"],
+        help="recorder to pretend to be")
+    parser.add_argument(
+        "-f",
+        "--files",
+        type=int,
+        default=20,
+        dest="files",
+        help="number of takes on the card")
+    parser.add_argument(
+        "-t",
+        "--seconds",
+        type=float,
+        default=60,
+        dest="seconds",
+        help="length of each take (48KHz 16bit stereo)")
+
+    # Unsolicited traffic, packets per second
+    parser.add_argument(
+        "--vu-rate", type=float, default=10, dest="vu_rate",
+        help="VU meter updates per second")
+    parser.add_argument(
+        "--counter-rate", type=float, default=1, dest="counter_rate",
+        help="counter updates per second")
+    parser.add_argument(
+        "--ready-rate", type=float, default=3, dest="ready_rate",
+        help="'ready' packets per second")
+    parser.add_argument(
+        "--stream-rate", type=float, dest="stream_rate",
+        help="StreamData packets per second (default is real time)")
+    options = parser.parse_args()
+
+    sim = Simulator(options.model, options.files, options.seconds,
+                    options.vu_rate, options.counter_rate, options.ready_rate,
+                    options.stream_rate)
+    print("Simulating a %s on %s:%s" % (options.model, options.tcp,
+                                        options.port))
+    try:
+        asyncio.run(sim.serve(options.tcp, int(options.port)))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    Run()
@@ -0,0 +1,3 @@
+from .framing import PacketBuffer
+from .decode import parse_header, parse_short, parse_packet
+from .client import DRClient
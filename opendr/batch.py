@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import fnmatch
+
+from .download import riff_size, verify_riff
+
+# =====================================================================
+# Several files from one listing over one connection, each request sent
+# as soon as the previous file is in. Files already on disk with the
+# listed size (and a sound header) are skipped, and the newest file taken
+# is remembered so the next run can ask for only what has been recorded
+# since.
+
+sync_file = ".opendr-sync.json"
+
+def entry_stamp(entry):
+    # FAT date and time as one number, sorts by time
+    return entry.Date << 16 | entry.Time
+
+def parse_range(text):
+    # "3-7,9" -> {3, 4, 5, 6, 7, 9}
+    indexes = set()
+    for part in text.split(","):
+        first, sep, last = part.partition("-")
+        indexes.update(range(int(first), int(last or first) + 1))
+    return indexes
+
+def last_sync(directory):
+    try:
+        with open(os.path.join(directory, sync_file)) as f:
+            return json.load(f).get("newest")
+    except (IOError, ValueError):
+        return None
+
+def save_sync(directory, newest):
+    with open(os.path.join(directory, sync_file), "w") as f:
+        json.dump({"newest": newest, "time": time.time()}, f)
+
+def select(entries, indexes=None, pattern=None, since=None):
+    # Files (not folders) matching all of the given selections
+    chosen = []
+    for entry in entries:
+        if entry.Directory:
+            continue
+        if indexes is not None and entry.Index not in indexes:
+            continue
+        if pattern is not None and not fnmatch.fnmatch(entry.Name, pattern):
+            continue
+        if since is not None and entry_stamp(entry) <= since:
+            continue
+        chosen.append(entry)
+    return chosen
+
+def present(filename, entry):
+    # Already downloaded: the listed size, and for a WAV/BWF its header
+    # agreeing with the file. A file by the same name from another unit
+    # is downloaded over
+    if not os.path.exists(filename) or \
+            os.path.getsize(filename) != entry.Size:
+        return False
+    with open(filename, "rb") as f:
+        if riff_size(f.read(12)) is not None:
+            return not verify_riff(filename)
+    return True
+
+
+class Batch(object):
+    def __init__(self):
+        self.files = []  # [(entry, Download or None if already present)]
+        self.taken = []
+        self.skipped = []
+        self.failed = []
+        self.received = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        return "%d downloaded, %d already present, %d failed, " \
+            "%.1f MB in %.2f s, %.2f MB/s" % (
+                len(self.taken), len(self.skipped), len(self.failed),
+                self.received / 1e6, self.elapsed,
+                self.received / self.elapsed / 1e6 if self.elapsed else 0)
+
+
+async def download_batch(client, entries, directory="."):
+    # Returns a Batch, with the entries taken, skipped and failed
+    batch = Batch()
+    newest = last_sync(directory)
+    start = time.perf_counter()
+
+    for entry in entries:
+        filename = os.path.join(directory, entry.Name)
+        if present(filename, entry):
+            batch.files.append((entry, None))
+            batch.skipped.append(entry)
+        else:
+            download = await client.download(entry.Index, filename,
+                                             entry.Size)
+            batch.files.append((entry, download))
+            batch.received += download.received
+            if not download.complete:
+                batch.failed.append(entry)
+                if client.transport is None:
+                    break
+                continue
+            batch.taken.append(entry)
+    batch.elapsed = time.perf_counter() - start
+
+    # Up to the first file missed, so it is picked up next time
+    stamps = [entry_stamp(entry) for entry in batch.taken + batch.skipped]
+    if batch.failed:
+        first = min(entry_stamp(entry) for entry in batch.failed)
+        stamps = [stamp for stamp in stamps if stamp < first]
+    if stamps:
+        save_sync(directory, max([newest or 0] + stamps))
+    return batch
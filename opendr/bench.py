@@ -0,0 +1,287 @@
+import os
+import timeit
+import tempfile
+import asyncio
+import binascii
+
+from construct import *
+
+from .protocol import *
+from .decode import parse_header, parse_short, short_decoders, packet_type, \
+    LazyPacket
+from .framing import PacketBuffer
+from .files import parse_file_entries
+from .client import DRClient
+from .replay import load_capture, replay
+
+# =====================================================================
+# Offline benchmark, replaying the recorder's side of a capture
+
+def frame_concat(segments, parse, header=check_packet.parse,
+                 short=short_packet.parse):
+    # Original approach, grow a bytes buffer and slice off each packet
+    count = 0
+    buffer = b""
+    for data in segments:
+        buffer += data
+        while len(buffer) >= 14:
+            log = header(buffer)
+            length = 14
+            if log.Flags.Long:
+                length += log.length
+            if len(buffer) < length:
+                break
+            if parse:
+                if log.Flags.Long:
+                    long_packet.parse(buffer)
+                else:
+                    short(buffer)
+            buffer = buffer[length:]
+            count += 1
+    return count
+
+def frame_header(segments, parse):
+    # The original framing with the header and short packet decoding
+    # PacketBuffer/frame_view use, so against frame_concat it shows the
+    # decoding gain and against frame_view the framing gain alone
+    return frame_concat(segments, parse, parse_header, parse_short)
+
+def frame_view(segments, parse):
+    count = 0
+    buffer = PacketBuffer()
+    for data in segments:
+        buffer.feed(data)
+        for log, packet in buffer.packets():
+            if parse:
+                if log.Flags.Long:
+                    long_packet.parse(packet)
+                else:
+                    parse_short(packet)
+            count += 1
+    return count
+
+def frame_lazy(segments, parse):
+    # As frame_view, but long packets only have their header decoded
+    count = 0
+    buffer = PacketBuffer()
+    for data in segments:
+        buffer.feed(data)
+        for log, packet in buffer.packets():
+            if parse:
+                if log.Flags.Long:
+                    LazyPacket(packet).body
+                else:
+                    parse_short(packet)
+            count += 1
+    return count
+
+def same_entries(packet):
+    fast = parse_file_entries(bytes(packet[14:]))
+    slow = long_packet.parse(packet).Long.FileEntries
+    return [(e.Index, e.Directory, e.Date, e.Time, e.Size, e.Name)
+            for e in fast] == \
+        [(e.Meta.Index, e.Meta.Directory, e.Date, e.Time, e.Size, e.Name)
+         for e in slow]
+
+def Verify(filenames):
+    # Check the fast path against construct for every packet in the dumps
+    checked = fast = failed = entries = 0
+    for filename in filenames:
+        for source in ("192.168.1.1", "192.168.1.22"):
+            buffer = PacketBuffer()
+            for timestamp, data in load_capture(filename, source):
+                buffer.feed(data)
+                for log, packet in buffer.packets():
+                    checked += 1
+                    if log != check_packet.parse(packet):
+                        failed += 1
+                        print("Header mismatch:",
+                              binascii.hexlify(packet[:14]))
+                    if log.Flags.Long:
+                        if packet[2:5] == b"\x40\x20\x10":
+                            entries += 1
+                            if not same_entries(packet):
+                                failed += 1
+                                print("FileEntries mismatch:",
+                                      binascii.hexlify(packet[:14]))
+                        continue
+
+                    if bytes(packet[2:6]) in short_decoders or \
+                            bytes(packet[2:5]) in short_decoders or \
+                            bytes(packet[2:4]) in short_decoders:
+                        fast += 1
+                    if parse_short(packet) != short_packet.parse(packet):
+                        failed += 1
+                        print("Mismatch:", binascii.hexlify(packet))
+            if buffer.resyncs or buffer.truncated:
+                print("%s (%s): %s" % (filename, source, buffer.report()))
+
+    print("%d packets checked, %d on the fast path, %d file tables, "
+          "%d mismatches" % (checked, fast, entries, failed))
+    return failed == 0
+
+def chunks(data, size=0x10000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def Compare(captures, repeat=10):
+    # Each capture as captured and as if the socket had backed up into
+    # large reads, plus 1s of 48KHz streaming audio (none in the captures)
+    audio = b"\x44\x52\xf0\x20\x20\x01\x01\x00\x00\x00\x00\x00\x05\x68" + \
+        b"\x00" * 0x568
+    streaming = audio * (48000 * 4 // 0x568)
+
+    for name, feeds in (
+            ("segments", captures),
+            ("64k reads", [chunks(b"".join(c)) for c in captures]),
+            ("streaming", [chunks(streaming)])):
+        total = sum(len(d) for data in feeds for d in data)
+
+        for parse in (False, True):
+            for method in (frame_concat, frame_header, frame_view,
+                           frame_lazy):
+                start = timeit.default_timer()
+                for r in range(repeat):
+                    count = sum(method(data, parse) for data in feeds)
+                elapsed = (timeit.default_timer() - start) / repeat
+                print("%-9s %-6s %-12s: %6d packets, %8.2f ms, %6.2f MB/s" %
+                      (name, "decode" if parse else "frame", method.__name__,
+                       count, elapsed * 1000, total / elapsed / 1e6))
+
+    # Decode only, for the short packets in the captures
+    packets = []
+    for segments in captures:
+        buffer = PacketBuffer()
+        for data in segments:
+            buffer.feed(data)
+            packets.extend(bytes(packet) for log, packet in buffer.packets()
+                           if not log.Flags.Long)
+
+    for method in (short_packet.parse, parse_short):
+        start = timeit.default_timer()
+        for r in range(repeat):
+            for packet in packets:
+                method(packet)
+        elapsed = (timeit.default_timer() - start) / repeat
+        print("short decode %-19s: %6d packets, %10.0f packets/s" %
+              (method.__name__ if method is parse_short else "short_packet.parse",
+               len(packets), len(packets) / elapsed))
+
+class TimedClient(DRClient):
+    # Times the client's own dispatch (decode and routing) per packet type
+    def __init__(self):
+        DRClient.__init__(self)
+        self.latency = {}
+        self.packets = 0
+        self.bytes = 0
+
+    def dispatch(self, header, packet):
+        start = timeit.default_timer()
+        DRClient.dispatch(self, header, packet)
+        elapsed = timeit.default_timer() - start
+
+        self.latency.setdefault(packet_type(packet), []).append(elapsed)
+        self.packets += 1
+        self.bytes += len(packet)
+
+def Benchmark(filenames, repeat=10):
+    captures = []
+    for filename in filenames:
+        captured = load_capture(filename)
+        captures.append([data for timestamp, data in captured])
+
+        client = TimedClient()
+        start = timeit.default_timer()
+        asyncio.run(replay(client, captured))
+        elapsed = timeit.default_timer() - start
+
+        print("%s: %d packets, %d bytes, %.1f ms, %.0f packets/s, %.2f MB/s" %
+              (filename, client.packets, client.bytes, elapsed * 1000,
+               client.packets / elapsed, client.bytes / elapsed / 1e6))
+        for kind, times in sorted(client.latency.items()):
+            times.sort()
+            print("    %-8s %6d packets, mean %7.1f us, p99 %7.1f us, max %7.1f us" %
+                  (kind, len(times), sum(times) / len(times) * 1e6,
+                   times[int(len(times) * 0.99)] * 1e6, times[-1] * 1e6))
+
+    print("Framing and decoding, original against current")
+    Compare(captures, repeat)
+
+def summary(times):
+    times = sorted(times)
+    return "min %.2f ms, mean %.2f ms, p99 %.2f ms, max %.2f ms" % (
+        times[0] * 1000, sum(times) / len(times) * 1000,
+        times[int(len(times) * 0.99)] * 1000, times[-1] * 1000)
+
+async def LoadTest(host, port, count=200, seconds=2.0):
+    # Against the simulator (or a recorder): command round trip,
+    # download and streaming throughput, while counting updates
+    client = DRClient(host, port)
+    await client.connect(settle=0.1)
+
+    updates = [0]
+    async def monitor():
+        async for log in client.updates():
+            updates[0] += 1
+    task = asyncio.ensure_future(monitor())
+    started = timeit.default_timer()
+
+    times = []
+    for i in range(count):
+        start = timeit.default_timer()
+        await client.read_register(0x01, 0x01)
+        times.append(timeit.default_timer() - start)
+    print("Register read round trip (%d): %s" % (count, summary(times)))
+
+    start = timeit.default_timer()
+    entries = await client.list_files()
+    print("File table: %d entries in %.1f ms" %
+          (len(entries), (timeit.default_timer() - start) * 1000))
+
+    files = [entry for entry in entries if not entry.Directory]
+    if files:
+        entry = max(files, key=lambda entry: entry.Size)
+        with tempfile.TemporaryDirectory() as directory:
+            download = await client.download(
+                entry.Index, os.path.join(directory, entry.Name),
+                entry.Size, resume=False)
+        print("Download", download.report())
+        print("Writer:", client.writer.report())
+
+    received = packets = 0
+    stream = client.stream()
+    start = timeit.default_timer()
+    async for rate, offset, data in stream:
+        received += len(data)
+        packets += 1
+        if timeit.default_timer() - start > seconds:
+            break
+    await stream.aclose()
+    elapsed = timeit.default_timer() - start
+    print("Stream: %d packets, %d bytes in %.2f s, %.0f packets/s, %.2f MB/s" %
+          (packets, received, elapsed, packets / elapsed,
+           received / elapsed / 1e6))
+
+    elapsed = timeit.default_timer() - started
+    print("Updates: %d in %.2f s, %.0f/s" % (updates[0], elapsed,
+                                             updates[0] / elapsed))
+    task.cancel()
+    await client.close()
+
+    await Burst(host, port)
+
+async def Burst(host, port, bursts=50, size=16):
+    # Time for a burst of register reads (as --reg) to all be answered,
+    # with and without coalescing the commands and TCP_NODELAY
+    for coalesce, nodelay in ((False, True), (True, True),
+                              (False, False), (True, False)):
+        client = DRClient(host, port, coalesce=coalesce, nodelay=nodelay)
+        await client.connect(settle=0.1)
+        times = []
+        for i in range(bursts):
+            start = timeit.default_timer()
+            await asyncio.gather(*[client.read_register(0x01, reg)
+                                   for reg in range(size)])
+            times.append(timeit.default_timer() - start)
+        print("Burst of %d, coalesce %-5s nodelay %-5s: %s, %d writes" %
+              (size, coalesce, nodelay, summary(times), client.writes))
+        await client.close()
@@ -0,0 +1,439 @@
+import time
+import socket
+import struct
+import asyncio
+import datetime
+import binascii
+
+from construct import *
+
+from .protocol import *
+from .decode import parse_short, parse_stream_header, parse_file_data_header, \
+    LazyPacket
+from .framing import PacketBuffer
+from .writer import Writer
+from .download import Download
+from .files import parse_file_entries
+from . import encoder
+
+# =====================================================================
+# Event driven client, the socket is only serviced when data arrives and
+# commands are written out as soon as they are issued
+
+def register_match(bank, reg):
+    # Register responses, 0x3020 or 0x30a5 (not valid) for bank/reg
+    address = struct.pack(">BB", bank, reg)
+
+    def match(log, packet):
+        return packet[2] == 0x30 and packet[3] in (0x20, 0xa5) and \
+            packet[4:6] == address
+    return match
+
+def reply_match(command, size=1):
+    # Replies to 0x2042/0xf041 etc. requests come back as 0x2020/0xf020
+    # with the same type, the first 'size' bytes after the command
+    kind = command[2]
+    key = bytes(command[4:4 + size])
+
+    def match(log, packet):
+        return packet[2] == kind and packet[3] == 0x20 and \
+            packet[4:4 + size] == key
+    return match
+
+
+class DRProtocol(asyncio.BufferedProtocol):
+    def __init__(self, client):
+        self.client = client
+        self.buffer = PacketBuffer()
+        client.buffer = self.buffer  # for its framing counters
+
+    def get_buffer(self, sizehint):
+        return self.buffer.writable(max(sizehint, 0x10000))
+
+    def buffer_updated(self, nbytes):
+        buffer = self.buffer
+        buffer.written(nbytes)
+        client = self.client
+        if client.metrics is None and client.capture is None:
+            for header, packet in buffer.packets():
+                client.dispatch(header, packet)
+            return
+
+        metrics = client.metrics
+        capture = client.capture
+        if metrics is not None:
+            metrics.read(nbytes)
+        if capture is not None:
+            capture.read(buffer.view[buffer.end - nbytes:buffer.end])
+        for header, packet in buffer.packets():
+            if capture is not None:
+                capture.packet(packet, buffer.end - buffer.start)
+            start = time.perf_counter()
+            client.dispatch(header, packet)
+            if metrics is not None:
+                metrics.packet(packet, time.perf_counter() - start)
+
+    def connection_lost(self, exc):
+        self.client.closed(exc)
+
+
+class DRClient(object):
+    def __init__(self, host="192.168.1.1", port=8010, timeout=5.0,
+                 debug=False, coalesce=True, nodelay=True):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.debug = debug
+        self.transport = None
+        self.buffer = None
+        self.ended = False  # the connection has been lost (or replayed)
+
+        # Commands sent in the same event loop tick go out in one write,
+        # 'nodelay' is TCP_NODELAY on the socket
+        self.coalesce = coalesce
+        self.nodelay = nodelay
+        self.pending = []
+        self.commands = 0
+        self.writes = 0
+
+        self.waiters = []
+        self.queues = []
+        self.listing = None
+        self.storage = None
+        self.streams = []
+        self.writer = None
+        self.registers = None  # RegisterCache, see registers.py
+        self.files = None  # FileIndex, see files.py
+        self.metrics = None  # Metrics, see metrics.py
+        self.capture = None  # SessionRecorder, see session.py
+        self.levels = None  # VUArchive, see vu.py
+
+    async def connect(self, settle=1.0):
+        loop = asyncio.get_running_loop()
+        self.transport, protocol = await loop.create_connection(
+            lambda: DRProtocol(self), self.host, self.port)
+        self.ended = False
+        sock = self.transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                            int(self.nodelay))
+
+        self.send(b"\x44\x52\x20\x42\x07\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+        await asyncio.sleep(settle)
+        return self
+
+    async def close(self):
+        if self.transport:
+            self.flush()
+            self.transport.close()
+            self.transport = None
+        if self.registers is not None:
+            self.registers.save()
+        if self.levels is not None:
+            levels, self.levels = self.levels, None
+            await asyncio.get_running_loop().run_in_executor(None,
+                                                             levels.close)
+        if self.capture is not None:
+            capture, self.capture = self.capture, None
+            await asyncio.get_running_loop().run_in_executor(None,
+                                                             capture.close)
+        if self.writer:
+            writer, self.writer = self.writer, None
+            await asyncio.get_running_loop().run_in_executor(None, writer.close)
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # =================================================================
+    # Receive side, called by DRProtocol for every complete packet
+
+    def dispatch(self, header, packet):
+        if self.debug:
+            if header.Flags.Long:
+                print("Buf:", binascii.hexlify(packet[:32]), "...",
+                      header.length)
+            else:
+                print("Buf:", binascii.hexlify(packet))
+
+        if header.Flags.Long:
+            # Bulk data goes straight from the receive buffer to its
+            # consumer, without being decoded by construct
+            lazy = LazyPacket(packet)
+            if lazy.type == 0x2020 and self.streams:
+                rate, offset = parse_stream_header(packet)
+                block = (rate, offset, bytes(lazy.body))
+                for queue in self.streams:
+                    queue.put_nowait(block)
+                return
+            elif lazy.type == 0x2010 and self.listing:
+                self.listing.table(struct.unpack_from(">I", packet, 6)[0],
+                                   lazy.body)
+                return
+            elif lazy.type == 0x2032 and lazy.flags == 0x40 and self.storage:
+                seq, offset = parse_file_data_header(packet)
+                self.storage.data(offset, lazy.body)
+                return
+        try:
+            log = lazy.log if header.Flags.Long else parse_short(packet)
+        except ConstructError:
+            # Framed but not decodable (corrupted), only this packet is lost
+            if self.buffer is not None:
+                self.buffer.undecoded += 1
+            return
+        if not header.Flags.Long:
+            if self.registers is not None:
+                self.registers.update(packet)
+            if self.levels is not None:
+                self.levels.update(packet)
+
+        for waiter in self.waiters:
+            match, future = waiter
+            if not future.done() and match(log, packet):
+                self.waiters.remove(waiter)
+                future.set_result((log, bytes(packet)))
+                return
+
+        if log.get('Long'):
+            if log.Long.get('File'):
+                return
+
+        for queue in self.queues:
+            queue.put_nowait(log)
+
+    def closed(self, exc):
+        self.transport = None
+        self.ended = True
+        self.pending = []
+        for match, future in self.waiters:
+            if not future.done():
+                future.set_exception(ConnectionError("connection lost"))
+        self.waiters = []
+        for queue in self.queues + self.streams:
+            queue.put_nowait(None)
+        for pending in (self.listing, self.storage):
+            if pending:
+                pending.done.set()
+
+    def expect(self, match):
+        # Future for the next packet that 'match'es, (log, packet)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((match, future))
+        return future
+
+    def forget(self, future):
+        self.waiters = [waiter for waiter in self.waiters
+                        if waiter[1] is not future]
+
+    async def request(self, command, match, timeout=None):
+        # Send 'command' and wait for the first packet that 'match'es,
+        # returns (log, packet)
+        future = self.expect(match)
+        self.send(command)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self.forget(future)
+
+    async def updates(self):
+        # Decoded packets not consumed by a request/download/stream,
+        # ie. status updates, 'ready', unsolicited responses, until the
+        # connection is lost
+        if self.ended:
+            return
+        queue = asyncio.Queue()
+        self.queues.append(queue)
+        try:
+            while True:
+                log = await queue.get()
+                if log is None:
+                    return
+                yield log
+        finally:
+            self.queues.remove(queue)
+
+    def get_writer(self):
+        # The thread doing the disk writes for downloads and streams,
+        # started on first use
+        if self.writer is None:
+            self.writer = Writer()
+            self.writer.watch(asyncio.get_running_loop(), self.pause_reading,
+                              self.resume_reading)
+        return self.writer
+
+    def pause_reading(self):
+        # Backpressure from the Writer, the socket is left unread
+        if self.transport is not None:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self.transport is not None and \
+                not self.transport.is_reading():
+            self.transport.resume_reading()
+
+    # =================================================================
+    # Commands
+
+    def send(self, data):
+        if self.transport is None:
+            raise ConnectionError("not connected")
+        self.commands += 1
+        if not self.coalesce:
+            self.writes += 1
+            self.transport.write(data)
+            if self.capture is not None:
+                self.capture.sent(data)
+            return
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.pending.append(data)
+
+    def flush(self):
+        # One write (sendmsg where the transport supports it) for all the
+        # commands queued since the last one
+        pending, self.pending = self.pending, []
+        if pending and self.transport is not None:
+            self.writes += 1
+            self.transport.writelines(pending)
+            if self.capture is not None:
+                for data in pending:
+                    self.capture.sent(data)
+
+    async def keycode(self, keycode):
+        self.send(encoder.keycode(keycode))
+
+    async def set_level(self, level1, level2=None, level3=0, level4=0):
+        # Note Ch3&4 on DR-44WL have differ scale/range
+        self.send(encoder.level(level1, level1 if level2 is None else level2,
+                                level3, level4))
+
+    async def set_clock(self, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+
+        clock = set_clock.build({
+            "Year":   now.year,
+            "Month":  now.month,
+            "Day":    now.day,
+            "Hour":   now.hour,
+            "Minute": now.minute,
+            "Second": now.second,
+            })
+
+        # For some reason you have to send this twice, kept as two writes
+        self.send(clock)
+        self.flush()
+        self.send(clock)
+        return now
+
+    async def read_register(self, bank, reg, timeout=None):
+        # Returns the decoded register (log.Short), or None when the
+        # recorder answers with 0xa5 (register not valid)
+        log, packet = await self.request(
+            encoder.register_read(bank, reg), register_match(bank, reg),
+            timeout)
+        if packet[3] == 0xa5:
+            return None
+        return log.Short
+
+    async def sys_info(self, timeout=None):
+        def match(log, packet):
+            return log.get('Long') and log.Long.get('SysInfo')
+
+        log, packet = await self.request(
+            b"\x44\x52\xf0\x41\x00\x02\x00\x00\x00\x00\x00\x00\x00\x00",
+            match, timeout)
+        return log.Long.SysInfo
+
+    async def list_files(self, timeout=None):
+        # The table arrives over several packets, each with the total
+        # number of entries in the header. Returns FileEntry's (files.py),
+        # with a FileIndex in 'files' unchanged packets are not decoded
+        self.listing = Listing(self.files)
+        try:
+            self.send(b"\x44\x52\x40\x41\x10\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+            await asyncio.wait_for(self.listing.done.wait(),
+                                   timeout or self.timeout)
+        finally:
+            listing, self.listing = self.listing, None
+        return listing.entries
+
+    async def download(self, index, filename=None, size=None, resume=True,
+                       timeout=None):
+        # Without a name/size the file table is read to find them, returns
+        # the Download (see download.py) which is 'complete' or not, given
+        # up on when no data arrives for 'timeout' seconds
+        if filename is None or size is None:
+            for entry in await self.list_files():
+                if entry.Index == index:
+                    filename = filename or entry.Name
+                    size = entry.Size if size is None else size
+                    break
+            else:
+                raise ValueError("no file with index %d" % index)
+
+        writer = self.get_writer()
+        self.storage = Download(filename, size, writer, resume)
+        try:
+            self.send(req_download.build({"Index": index}))
+            storage = self.storage
+            timeout = timeout or self.timeout
+            while not storage.done.is_set():
+                idle = time.perf_counter() - storage.last
+                if idle >= timeout:
+                    storage.stalled = idle
+                    break
+                try:
+                    await asyncio.wait_for(storage.done.wait(),
+                                           timeout - idle)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            storage, self.storage = self.storage, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, writer.sync)
+            storage.close()
+        return storage
+
+    async def stream(self):
+        # Yields (rate, offset, data) for blocks of streamed audio (16bit
+        # stereo, little endian), see parse_stream_header(), streaming
+        # is started for the first of any number of consumers
+        if self.ended:
+            return
+        queue = asyncio.Queue()
+        self.streams.append(queue)
+        try:
+            if len(self.streams) == 1:
+                self.send(b"\x44\x52\xf0\x41\x21\x01\x00\x00\x00\x00\x00\x00\x00\x00")
+            while True:
+                block = await queue.get()
+                if block is None:
+                    return
+                yield block
+        finally:
+            self.streams.remove(queue)
+
+
+class Listing(object):
+    def __init__(self, index=None):
+        self.index = index
+        self.pages = 0
+        self.entries = []
+        self.done = asyncio.Event()
+
+    def table(self, total, body):
+        # Pages are counted as they arrive, the page number in the header
+        # is only a byte
+        if self.index is not None:
+            entries = self.index.page(self.pages, total, body)
+        else:
+            entries = parse_file_entries(bytes(body))
+        self.pages += 1
+        self.entries.extend(entries)
+        if len(self.entries) >= total:
+            if self.index is not None:
+                self.index.finish(self.pages, total)
+            self.done.set()
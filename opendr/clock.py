@@ -0,0 +1,89 @@
+import time
+import asyncio
+import datetime
+
+from .protocol import set_clock
+from .client import reply_match
+
+# =====================================================================
+# Setting the recorder's clock so it lands on a whole second. The round
+# trip is measured with status reads (0x2042/0x00), and set_clock is sent
+# half the shortest round trip before the second it carries. The clock
+# only has whole seconds, so that is the best that can be done from here.
+
+status_read = b"\x44\x52\x20\x42\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+counter_read = b"\x44\x52\x20\x42\x11\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+async def round_trips(client, count=10, command=status_read):
+    times = []
+    match = reply_match(command)
+    for i in range(count):
+        start = time.perf_counter()
+        await client.request(command, match)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+def next_second(lead=0.5):
+    # Wall clock time of the next whole second at least 'lead' away
+    return float(int(time.time() + lead) + 1)
+
+class ClockSync(object):
+    def __init__(self, name):
+        self.name = name
+        self.rtt = []
+        self.target = None
+        self.late = None  # sent compared to planned, seconds
+        self.after = None  # counter read round trip after setting
+
+    def report(self):
+        rtt = self.rtt
+        return "%s: set %s, rtt min %.2f ms median %.2f ms, sent %+.3f ms " \
+            "from plan, lands within +/-%.2f ms, counter read after %.2f ms" % (
+                self.name,
+                datetime.datetime.fromtimestamp(self.target).strftime(
+                    "%Y-%m-%d %H:%M:%S"),
+                rtt[0] * 1000, rtt[len(rtt) // 2] * 1000, self.late * 1000,
+                (rtt[len(rtt) // 2] - rtt[0]) / 2 * 1000 + abs(self.late) * 1000,
+                self.after * 1000)
+
+async def set_at(client, target, rtt):
+    # Sends set_clock for 'target' (wall clock seconds) to arrive then
+    result = ClockSync("%s:%d" % (client.host, client.port))
+    result.rtt = rtt
+    result.target = target
+
+    now = datetime.datetime.fromtimestamp(target)
+    clock = set_clock.build({
+        "Year":   now.year,
+        "Month":  now.month,
+        "Day":    now.day,
+        "Hour":   now.hour,
+        "Minute": now.minute,
+        "Second": now.second,
+        })
+
+    send = target - rtt[0] / 2
+    delay = send - time.time() - 0.002
+    if delay > 0:
+        await asyncio.sleep(delay)
+    while time.time() < send:
+        pass
+
+    # As DRClient.set_clock(), sent twice
+    client.send(clock)
+    client.flush()
+    result.late = time.time() - send
+    client.send(clock)
+    client.flush()
+
+    result.after = (await round_trips(client, 1, counter_read))[0]
+    return result
+
+async def sync_clocks(clients, count=10):
+    # Round trips to every recorder first, then all are set for the same
+    # second, returns a ClockSync for each
+    rtts = await asyncio.gather(*[round_trips(client, count)
+                                  for client in clients])
+    target = next_second()
+    return await asyncio.gather(*[set_at(client, target, rtt)
+                                  for client, rtt in zip(clients, rtts)])
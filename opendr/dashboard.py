@@ -0,0 +1,138 @@
+import sys
+import asyncio
+
+# =====================================================================
+# Terminal display of the latest state. Updates only change the state
+# here, whatever the rate they arrive at, and the screen is redrawn at a
+# fixed frame rate with ANSI cursor moves, only the cells that changed
+# since the last frame being written, so a slow terminal (SSH) costs a
+# bounded amount per frame and never backs up the receive side.
+
+bar = (" " * 32) + ("*" * 32) + (" " * 32)
+
+class Dashboard(object):
+    def __init__(self, name="", mtr=False, out=None):
+        self.name = name
+        self.pairs = [(2, "ST "), (0, "1/2"), (1, "3/4")] if mtr else \
+            [(0, "   ")]
+        self.out = out or sys.stdout
+
+        self.vu = None
+        self.levels = None  # from meter.py
+        self.status = "-"
+        self.counter = None
+        self.arm = None
+        self.screen = {}  # name : value, in order seen
+        self.other = "-"
+        self.updates = 0
+
+        self.shown = []  # lines on screen
+        self.frames = 0
+        self.written = 0
+
+    # =================================================================
+    # State, from DRClient.updates()
+
+    def update(self, log):
+        self.updates += 1
+        short = log.get('Short')
+        update = short and short.get('Update')
+        if not update:
+            if short and not short.get('Ready'):
+                self.other = str(short.get('Register') or short)
+            return
+
+        if update.get('VUMeters') is not None:
+            # Once there are measured levels, the recorder's VU is not shown
+            if update.get('Levels') is not None:
+                self.levels = update.Levels
+            elif self.levels is not None:
+                return
+            self.vu = update
+        elif update.get('Counter') is not None:
+            self.counter = update.Counter
+        elif update.get('Status') is not None:
+            self.status = str(update.Status)
+        elif update.get('ScreenInfo') is not None:
+            for name, value in update.ScreenInfo.items():
+                if not name.startswith("_"):
+                    self.screen[name] = str(value)
+        elif update.get('CH1') is not None:
+            self.arm = update
+        else:
+            self.other = str(update)
+
+    # =================================================================
+    # Drawing
+
+    def lines(self):
+        lines = ["%s  %-10s  Counter %-10s  Arm %s" % (
+            self.name, self.status,
+            "-" if self.counter is None else self.counter,
+            "-" if self.arm is None else " ".join(
+                "%d" % self.arm["CH%d" % ch] for ch in range(1, 5)))]
+
+        for pair, label in self.pairs:
+            if self.vu is None:
+                lines.append("%s %s : %4s : %s" % (label, " " * 32, "",
+                                                   " " * 32))
+                continue
+            meter = self.vu.VUMeters[pair]
+            l = meter.BarL
+            r = meter.BarR
+            d = self.vu.DecimalVU if pair == self.pairs[0][0] else ""
+            lines.append("%s %s%s: %4s :%s%s" % (
+                label, bar[l:l + 32], "!" if meter.Peek else " ", d,
+                "!" if meter['12dB'] else " ", bar[64 - r:96 - r]))
+
+        if self.levels is not None:
+            lines.append("dBFS peak %6.1f %6.1f  rms %6.1f %6.1f  true peak "
+                         "%6.1f %6.1f  clips %d %d" % tuple(
+                             self.levels.Peak + self.levels.RMS +
+                             self.levels.TruePeak + self.levels.Clips))
+        lines.append("  ".join("%s %s" % item
+                               for item in self.screen.items()) or "-")
+        lines.append(self.other[:100])
+        return lines
+
+    def frame(self):
+        # ANSI for the changes since the last frame
+        output = []
+        lines = self.lines()
+        for row, line in enumerate(lines):
+            old = self.shown[row] if row < len(self.shown) else ""
+            if line == old:
+                continue
+            width = max(len(line), len(old))
+            line = line.ljust(width)
+            old = old.ljust(width)
+            first = 0
+            while line[first] == old[first]:
+                first += 1
+            last = width
+            while line[last - 1] == old[last - 1]:
+                last -= 1
+            output.append("\x1b[%d;%dH%s" % (row + 1, first + 1,
+                                             line[first:last]))
+        self.shown = lines
+        return "".join(output)
+
+    async def run(self, fps=10.0):
+        # Redraws until cancelled
+        self.out.write("\x1b[2J\x1b[?25l")
+        try:
+            while True:
+                output = self.frame()
+                if output:
+                    self.out.write(output)
+                    self.out.flush()
+                    self.written += len(output)
+                self.frames += 1
+                await asyncio.sleep(1.0 / fps)
+        finally:
+            self.out.write("\x1b[%d;1H\x1b[?25h\n" % (len(self.shown) + 1))
+            self.out.flush()
+
+    def report(self):
+        return "%d updates, %d frames, %d bytes to the terminal" % (
+            self.updates, self.frames, self.written)
@@ -0,0 +1,182 @@
+import struct
+
+from construct import *
+
+from .protocol import *
+
+# =====================================================================
+# Fast path for the 14 byte packets. The construct Structs in protocol are
+# turned into precompiled struct formats, keyed on the type bytes, and
+# give the same Containers as short_packet.parse(). Anything not in the
+# table (or not made of fixed size fields) falls back to construct.
+
+header_format = struct.Struct(">2sB9xH")
+
+def parse_header(data):
+    # Same as check_packet.parse()
+    magic, flags, length = header_format.unpack_from(data)
+    if magic != b"DR":
+        raise ConstError("parsing expected b'DR' but parsed %r" % magic)
+    return Container(Flags=Container(Long=(flags >> 6) & 1), length=length)
+
+def flat_format(st):
+    # Returns struct format and [(name, enum mapping)] for a Struct of
+    # fixed size big-endian fields, or None if it can not be flattened
+    fmt = ">"
+    fields = []
+    for sc in st.subcons:
+        field = sc.subcon if isinstance(sc, Renamed) else sc
+        mapping = None
+        if isinstance(field, Enum):
+            mapping = field.decmapping
+            field = field.subcon
+
+        if isinstance(field, FormatField) and field.fmtstr[0] == ">":
+            fmt += field.fmtstr[1:]
+        elif isinstance(field, Bytes) and isinstance(field.length, int):
+            fmt += "%ds" % field.length
+        elif isinstance(field, Padded) and field.subcon is Pass and not sc.name:
+            fmt += "%dx" % field.length
+            continue
+        else:
+            return None
+        fields.append((sc.name, mapping))
+    return fmt, fields
+
+def flat_decoder(st, offset, wrap):
+    # Decoder for a flat Struct at 'offset', 'wrap' rebuilds the outer
+    # Containers that the Switch'es would have produced
+    found = flat_format(st)
+    if found is None:
+        return None
+    unpack = struct.Struct(found[0]).unpack_from
+    fields = found[1]
+
+    def decode(packet):
+        inner = Container()
+        for (name, mapping), value in zip(fields, unpack(packet, offset)):
+            if mapping is not None:
+                value = mapping.get(value) or EnumInteger(value)
+            inner[name] = value
+        return wrap(inner)
+    return decode
+
+def switch_cases(st):
+    # {key: (name, Struct)} for the Switch in a Struct
+    for sc in st.subcons:
+        if isinstance(sc.subcon, Switch):
+            return dict((key, (case.name, case.subcon))
+                        for key, case in sc.subcon.cases.items())
+
+def decode_vumeters(packet):
+    meters = ListContainer()
+    for i in range(6, 12, 2):
+        meters.append(Container([
+            ("Peek", packet[i] >> 7),
+            ("BarL", packet[i] & 0x7f),
+            ("12dB", packet[i + 1] >> 7),
+            ("BarR", packet[i + 1] & 0x7f),
+        ]))
+    return Container(type=0x2020, Short=Container(type3=0x12, Update=Container(
+        VUMeters=meters,
+        DecimalVU=packet[12] - 256 if packet[12] & 0x80 else packet[12])))
+
+def decode_ready(packet):
+    return Container(type=0x2022, Short=Container(Ready=1))
+
+def build_short_decoders():
+    decoders = {
+        b"\x20\x20\x12": decode_vumeters,
+        b"\x20\x22": decode_ready,
+    }
+
+    def update(type3):
+        return lambda inner: Container(type=0x2020, Short=Container(
+            type3=type3, Update=inner))
+
+    def screen(type4):
+        return lambda inner: Container(type=0x2020, Short=Container(
+            type3=0x20, Update=Container(type4=type4, ScreenInfo=inner)))
+
+    def register(reg):
+        return lambda inner: Container(type=0x3020, Short=Container(
+            register=reg, Register=inner))
+
+    for type3, (name, st) in switch_cases(updates).items():
+        key = struct.pack(">HB", 0x2020, type3)
+        decoders.setdefault(key, flat_decoder(st, 5, update(type3)))
+
+    for type4, (name, st) in switch_cases(screeninfo).items():
+        key = struct.pack(">HBB", 0x2020, 0x20, type4)
+        decoders.setdefault(key, flat_decoder(st, 6, screen(type4)))
+
+    for reg, (name, st) in switch_cases(registers).items():
+        key = struct.pack(">HH", 0x3020, reg)
+        decoders.setdefault(key, flat_decoder(st, 6, register(reg)))
+
+    return dict((key, decode) for key, decode in decoders.items() if decode)
+
+short_decoders = build_short_decoders()
+
+def parse_short(packet):
+    # Drop-in for short_packet.parse(), most specific key first
+    key = bytes(packet[2:6])
+    decode = short_decoders.get(key) or short_decoders.get(key[:3]) or \
+        short_decoders.get(key[:2])
+    if decode:
+        return decode(packet)
+    return short_packet.parse(packet)
+
+def parse_packet(header, packet):
+    # 'header' from parse_header(), as yielded by PacketBuffer.packets()
+    if header.Flags.Long:
+        return long_packet.parse(packet)
+    return parse_short(packet)
+
+long_header = struct.Struct(">2sBH7xH")
+
+class LazyPacket(object):
+    # A long packet with only the 14 byte header decoded, 'body' is a view
+    # of the payload (valid while 'packet' is) and the construct Container
+    # is only built when 'log' is used
+    __slots__ = ("packet", "flags", "type", "length", "parsed")
+
+    def __init__(self, packet):
+        magic, self.flags, self.type, self.length = \
+            long_header.unpack_from(packet)
+        if magic != b"DR":
+            raise ConstError("parsing expected b'DR' but parsed %r" % magic)
+        self.packet = packet
+        self.parsed = None
+
+    @property
+    def body(self):
+        return self.packet[14:14 + self.length]
+
+    @property
+    def log(self):
+        if self.parsed is None:
+            self.parsed = long_packet.parse(self.packet)
+        return self.parsed
+
+def packet_type(packet):
+    # Short name for statistics, as written in protocol.txt: "2020:12"
+    # for updates, "3020" for registers, "f020:32"/"4020:32" for long
+    if packet[2] & 0x40 or packet[2:4] == b"\x20\x20":
+        return "%02x%02x:%02x" % (packet[2], packet[3], packet[4])
+    return "%02x%02x" % (packet[2], packet[3])
+
+stream_header = struct.Struct(">BxI")
+
+def parse_stream_header(packet):
+    # StreamData carries the sample rate (0 = 44.1KHz, 1 = 48KHz) and the
+    # offset of the first sample in the long packet header, bytes 5 and
+    # 7..10, returns (rate, offset)
+    return stream_header.unpack_from(packet, 5)
+
+file_data_header = struct.Struct(">BI")
+
+def parse_file_data_header(packet):
+    # FileData has a sequence number and the offset of the data in the
+    # file, bytes 5 and 6..9, returns (sequence, offset)
+    return file_data_header.unpack_from(packet, 5)
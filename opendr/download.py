@@ -0,0 +1,150 @@
+import os
+import time
+import struct
+import asyncio
+
+# =====================================================================
+# File transfer from the recorder. Data is written at the offset given in
+# each FileData header into a preallocated '.part' file, which is checked
+# and renamed when complete. An incomplete '.part' is kept, along with how
+# far it got, so a later download can carry on from there.
+#
+# The download request only carries the file index, so the recorder
+# always sends from the start, resuming saves writing (not receiving)
+# the part already on disk.
+
+def riff_size(data):
+    # Total file size from a WAV/BWF header, or None if not RIFF
+    if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return struct.unpack_from("<I", data, 4)[0] + 8
+    return None
+
+def verify_riff(filename):
+    # Returns a list of problems with the RIFF chunk sizes, empty if good
+    problems = []
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as f:
+        header = f.read(12)
+        expected = riff_size(header)
+        if expected is None:
+            return problems
+        if expected != size:
+            problems.append("RIFF size %d, file is %d bytes" % (expected, size))
+
+        chunks = {}
+        position = 12
+        while position + 8 <= size:
+            f.seek(position)
+            chunk, length = struct.unpack("<4sI", f.read(8))
+            chunks[chunk] = (position + 8, length)
+            position += 8 + length + (length & 1)
+        if position != size and not problems:
+            problems.append("chunks end at %d, file is %d bytes" %
+                            (position, size))
+        for chunk in (b"fmt ", b"data"):
+            if chunk not in chunks:
+                problems.append("no '%s' chunk" % chunk.decode())
+        if b"data" in chunks and sum(chunks[b"data"]) > size:
+            problems.append("data chunk runs %d bytes past the end" %
+                            (sum(chunks[b"data"]) - size))
+    return problems
+
+
+class Download(object):
+    def __init__(self, filename, size, writer, resume=True):
+        self.filename = filename
+        self.part = filename + ".part"
+        self.progress = self.part + ".offset"
+        self.size = size  # from the file table, then the WAV/BWF header
+        self.listed = size
+        self.writer = writer
+
+        self.skip = 0
+        if resume and os.path.exists(self.part) and \
+                os.path.exists(self.progress):
+            with open(self.progress) as f:
+                self.skip = min(int(f.read() or 0), size)
+        self.f = open(self.part, "r+b" if self.skip else "wb")
+        if hasattr(os, "posix_fallocate") and size:
+            os.posix_fallocate(self.f.fileno(), 0, size)
+        else:
+            self.f.truncate(size)
+
+        self.received = 0  # contiguous from the start
+        self.end = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.problems = []
+        self.requested = time.perf_counter()
+        self.first = None
+        self.finished = None
+        self.last = self.requested  # when data last arrived
+        self.stalled = None  # seconds without data when given up on
+        self.done = asyncio.Event()
+
+    def data(self, offset, data):
+        self.last = time.perf_counter()
+        if self.first is None:
+            self.first = self.last
+        if offset == 0:
+            expected = riff_size(data)
+            if expected is not None and expected != self.size:
+                self.problems.append("header gives %d bytes, listed as %d" %
+                                     (expected, self.listed))
+                self.size = expected
+
+        end = offset + len(data)
+        if offset > self.received:
+            self.gaps += 1
+        elif end <= self.received:
+            self.duplicates += 1
+        if end > self.skip:
+            start = max(offset, self.skip)
+            self.writer.write(self.f, start, data[start - offset:])
+        if offset <= self.received:
+            self.received = max(self.received, end)
+        self.end = max(self.end, end)
+
+        if self.end >= self.size:
+            self.finished = time.perf_counter()
+            self.done.set()
+
+    @property
+    def complete(self):
+        return self.received >= self.size
+
+    def close(self):
+        # After the writer has synced, keeps or finishes the '.part'
+        if self.complete:
+            self.f.truncate(self.size)
+            self.f.close()
+            self.problems.extend(verify_riff(self.part))
+            os.replace(self.part, self.filename)
+            if os.path.exists(self.progress):
+                os.remove(self.progress)
+        else:
+            self.f.close()
+            with open(self.progress, "w") as f:
+                f.write("%d" % max(self.received, self.skip))
+
+    def report(self):
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.requested
+        text = "%s: %d of %d bytes" % (self.filename, self.received,
+                                       self.size)
+        if self.skip:
+            text += " (%d already on disk)" % self.skip
+        if self.first is not None:
+            text += ", first byte %.1f ms, %.2f MB/s" % (
+                (self.first - self.requested) * 1000,
+                self.received / max(end - self.first, 1e-9) / 1e6)
+        text += ", %.2f s" % elapsed
+        if self.gaps or self.duplicates:
+            text += ", %d gaps, %d duplicates" % (self.gaps, self.duplicates)
+        if self.stalled is not None:
+            text += ", no data for %.1f s" % self.stalled
+        if not self.complete:
+            text += ", incomplete (kept as %s)" % self.part
+        for problem in self.problems:
+            text += "\n  " + problem
+        return text
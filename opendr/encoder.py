@@ -0,0 +1,25 @@
+import functools
+
+from .protocol import *
+
+# =====================================================================
+# Commands are built by construct once and the bytes reused after that,
+# every keycode up front and register reads/levels as they are first used
+
+keycodes = [send_keycode.build({"Keycode": keycode}) for keycode in range(256)]
+
+@functools.lru_cache(maxsize=None)
+def register_read(bank, reg):
+    return get_reg_bank.build({"Bank": bank, "Reg": reg})
+
+@functools.lru_cache(maxsize=1024)
+def level(level1, level2, level3, level4):
+    return set_level.build({
+        "Level1": level1,
+        "Level2": level2,
+        "Level3": level3,
+        "Level4": level4,
+        })
+
+def keycode(keycode):
+    return keycodes[keycode]
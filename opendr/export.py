@@ -0,0 +1,197 @@
+import os
+import math
+import struct
+
+import numpy
+
+from .replay import pcap_magic, pcap_packets, read_capture
+from .framing import PacketBuffer
+from .session import SessionReader, capture_file, RECEIVED
+from .vu import decode_vu
+
+# =====================================================================
+# Decoded sessions as columns, one table per packet family, from any
+# number of captures at once so questions like "which byte changes when
+# the dial moves" are one NumPy expression over all of them. Every table
+# has 'time' (wall clock seconds, NaN for the tshark text dumps),
+# 'capture' (index into 'captures') and 'raw', the bytes after the type
+# as an (N, n) uint8 array, for the fields that are not understood yet.
+#
+# Saved as .npz ("table/column" keys), or as a directory of Parquet
+# files, one per table, when pyarrow is installed.
+
+input_info_channel = struct.Struct(">xBHHH2x")
+
+class Table(object):
+    def __init__(self, columns, raw):
+        # 'columns' is [(name, dtype)], 'raw' the width of the raw bytes
+        self.columns = columns
+        self.raw = raw
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, *row):
+        self.rows.append(row)
+
+    def arrays(self):
+        columns = list(zip(*self.rows)) if self.rows else \
+            [[]] * (len(self.columns) + 1)
+        arrays = dict((name, numpy.array(values, dtype=dtype))
+                      for (name, dtype), values in zip(self.columns, columns))
+        arrays["raw"] = numpy.frombuffer(b"".join(columns[-1]),
+                                         numpy.uint8).reshape(-1, self.raw)
+        return arrays
+
+
+def table_columns(*columns):
+    return [("time", numpy.float64), ("capture", numpy.int16)] + \
+        list(columns)
+
+class Exporter(object):
+    def __init__(self):
+        self.captures = []
+        self.status = {}  # capture : last status
+        self.tables = {
+            "Status": Table(table_columns(("Status", numpy.uint8),
+                                          ("Previous", numpy.int16)), 9),
+            "Counter": Table(table_columns(("Counter", numpy.uint32)), 9),
+            # Decoded from 'raw' when saved
+            "VUMeters": Table(table_columns(), 7),
+            "ScreenInfo": Table(table_columns(("type4", numpy.uint8),
+                                              ("Value", numpy.uint8)), 8),
+            "Registers": Table(table_columns(("Register", numpy.uint16),
+                                             ("Valid", numpy.bool_),
+                                             ("Value", numpy.uint16)), 8),
+            "InputInfo": Table(table_columns(("Channel", numpy.uint8),
+                                             ("Link", numpy.uint8),
+                                             ("Delay", numpy.uint16),
+                                             ("LCF", numpy.uint16),
+                                             ("LVControl", numpy.uint16)),
+                               10),
+        }
+
+    # =================================================================
+    # Input
+
+    def packet(self, capture, time, packet):
+        # One packet from the recorder, anything not exported is ignored
+        tables = self.tables
+        kind = bytes(packet[2:5])
+        if kind == b"\x20\x20\x00":
+            status = packet[5]
+            previous = self.status.get(capture, -1)
+            if status != previous:
+                self.status[capture] = status
+                tables["Status"].append(time, capture, status, previous,
+                                        bytes(packet[5:14]))
+        elif kind == b"\x20\x20\x11":
+            tables["Counter"].append(time, capture,
+                                     struct.unpack_from(">I", packet, 6)[0],
+                                     bytes(packet[5:14]))
+        elif kind == b"\x20\x20\x12":
+            tables["VUMeters"].append(time, capture, bytes(packet[6:13]))
+        elif kind == b"\x20\x20\x20":
+            tables["ScreenInfo"].append(time, capture, packet[5], packet[6],
+                                        bytes(packet[6:14]))
+        elif kind[:2] in (b"\x30\x20", b"\x30\xa5"):
+            register, value = struct.unpack_from(">HH", packet, 4)
+            tables["Registers"].append(time, capture, register,
+                                       kind[1] == 0x20, value,
+                                       bytes(packet[6:14]))
+        elif kind[0] & 0x40 and kind[1:] == b"\x20\x31":
+            length = struct.unpack_from(">H", packet, 12)[0]
+            body = packet[14:14 + length]
+            channels = 1 if length == 0x14 else 4
+            for channel in range(channels):
+                raw = bytes(body[channel * 10:channel * 10 + 10])
+                if len(raw) < 10:
+                    break
+                tables["InputInfo"].append(
+                    time, capture, channel + 1,
+                    *input_info_channel.unpack(raw), raw)
+
+    def add(self, filename):
+        # A session capture, pcap or tshark text dump
+        capture = len(self.captures)
+        self.captures.append(filename)
+
+        if capture_file(filename):
+            reader = SessionReader(filename)
+            for i in range(len(reader)):
+                entry = reader[i]
+                if entry.direction == RECEIVED and \
+                        (entry.kind[:2] in (b"\x20\x20", b"\x30\x20",
+                                            b"\x30\xa5") or
+                         entry.kind[1:] == b"\x20\x31"):
+                    self.packet(capture, reader.wall + entry.time,
+                                reader.packet(i))
+            reader.close()
+            return
+
+        with open(filename, "rb") as f:
+            magic = f.read(4)
+        if magic in pcap_magic:
+            for timestamp, header, packet in pcap_packets(filename):
+                self.packet(capture, timestamp, packet)
+            return
+
+        buffer = PacketBuffer()
+        for data in read_capture(filename):
+            buffer.feed(data)
+            for header, packet in buffer.packets():
+                self.packet(capture, math.nan, packet)
+
+    # =================================================================
+    # Output
+
+    def arrays(self):
+        # {table: {column: array}}
+        arrays = dict((name, table.arrays())
+                      for name, table in self.tables.items())
+
+        vu = arrays["VUMeters"]
+        for name, values in decode_vu(vu["raw"]).items():
+            if values.ndim == 2:
+                for pair in range(3):
+                    vu["%s%d" % (name, pair)] = values[:, pair]
+            else:
+                vu[name] = values
+        return arrays
+
+    def save(self, filename):
+        arrays = self.arrays()
+        captures = numpy.array(self.captures)
+        if filename.endswith(".npz"):
+            flat = dict(("%s/%s" % (table, column), values)
+                        for table, columns in arrays.items()
+                        for column, values in columns.items())
+            flat["captures"] = captures
+            numpy.savez_compressed(filename, **flat)
+            return
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, "
+                               "or give a .npz filename")
+        if not os.path.isdir(filename):
+            os.makedirs(filename)
+        for table, columns in arrays.items():
+            columns = dict(columns)
+            raw = columns.pop("raw")
+            columns["raw"] = pyarrow.array([bytes(row) for row in raw],
+                                           pyarrow.binary(raw.shape[1]))
+            pyarrow.parquet.write_table(
+                pyarrow.table(columns),
+                os.path.join(filename, table + ".parquet"))
+        pyarrow.parquet.write_table(
+            pyarrow.table({"capture": self.captures}),
+            os.path.join(filename, "captures.parquet"))
+
+    def report(self):
+        return "%d captures, %s" % (len(self.captures), ", ".join(
+            "%s %d" % (name, len(table))
+            for name, table in self.tables.items()))
@@ -0,0 +1,156 @@
+import os
+import json
+import struct
+import binascii
+
+# =====================================================================
+# The recorder's file table. Entries are decoded straight from the bytes
+# (the construct file_entry walks the name a Short at a time), into small
+# slotted objects, and the raw pages are kept on disk per recorder so an
+# unchanged page does not need decoding again and the table can be looked
+# at without connecting.
+
+file_entry_header = struct.Struct(">HHHI")
+
+class FileEntry(object):
+    __slots__ = ("Index", "Directory", "Date", "Time", "Size", "Name")
+
+    def __init__(self, index, directory, date, time, size, name):
+        self.Index = index
+        self.Directory = directory
+        self.Date = date  # FAT style date/time
+        self.Time = time
+        self.Size = size
+        self.Name = name
+
+    def __repr__(self):
+        return "FileEntry(%d%s, %r, %d bytes)" % (
+            self.Index, " dir" if self.Directory else "", self.Name,
+            self.Size)
+
+def parse_file_entries(body):
+    # Same entries as file_entry, from the body of a FileEntries packet
+    entries = []
+    start = 0
+    end = len(body)
+    while start + 12 <= end:
+        meta, date, time, size = file_entry_header.unpack_from(body, start)
+        name = start + 10
+        # Terminator is the Short 0x000d, on a character boundary
+        stop = body.find(b"\x00\x0d", name)
+        while stop >= 0 and (stop - name) & 1:
+            stop = body.find(b"\x00\x0d", stop + 1)
+        if stop < 0:
+            break
+        entries.append(FileEntry(meta & 0x7fff, meta >> 15, date, time, size,
+                                 body[name:stop].decode("utf-16-le")))
+        start = stop + 2
+    return entries
+
+
+class FileIndex(object):
+    def __init__(self, path="~/.opendr"):
+        self.path = os.path.expanduser(path)
+        self.name = None
+        self.pages = {}  # page : (raw, [FileEntry])
+        self.indexes = {}  # Index : FileEntry
+        self.names = {}  # Name : FileEntry
+        self.total = None
+        self.changed = False
+
+    # =================================================================
+    # Persistence, one file per recorder address and SysInfo name (as
+    # RegisterCache)
+
+    def filename(self):
+        return os.path.join(self.path, "files-%s.json" % self.name)
+
+    def load(self, sys_info, unit=None):
+        # 'unit' tells recorders apart, see registers.unit_name()
+        self.name = sys_info.Name.strip()
+        if unit:
+            self.name += "-" + unit
+        self.pages = {}
+        self.indexes = {}
+        self.names = {}
+        try:
+            with open(self.filename()) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            return self
+        self.total = saved.get("total")
+        for page, raw in saved.get("pages", {}).items():
+            raw = binascii.unhexlify(raw)
+            self.pages[int(page)] = (raw, parse_file_entries(raw))
+            self.add(self.pages[int(page)][1])
+        return self
+
+    def save(self):
+        if self.name is None or not self.changed:
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        saved = {
+            "total": self.total,
+            "pages": dict(("%d" % page, binascii.hexlify(raw).decode())
+                          for page, (raw, entries) in self.pages.items()),
+        }
+        temp = self.filename() + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(saved, f)
+        os.replace(temp, self.filename())
+        self.changed = False
+
+    # =================================================================
+    # Refreshed by DRClient.list_files(), a page at a time
+
+    def page(self, page, total, body):
+        # Returns the entries for a page, only decoded if it changed
+        known = self.pages.get(page)
+        if known and known[0] == body:
+            return known[1]
+        raw = bytes(body)
+        entries = parse_file_entries(raw)
+        if known:
+            self.remove(known[1])
+        self.pages[page] = (raw, entries)
+        self.add(entries)
+        self.changed = True
+        return entries
+
+    def finish(self, pages, total):
+        # After a complete listing, pages past the end are gone
+        for page in [page for page in self.pages if page >= pages]:
+            self.remove(self.pages.pop(page)[1])
+            self.changed = True
+        if total != self.total:
+            self.total = total
+            self.changed = True
+        self.save()
+
+    def add(self, entries):
+        for entry in entries:
+            self.indexes[entry.Index] = entry
+            self.names[entry.Name] = entry
+
+    def remove(self, entries):
+        # Only where not since replaced by an entry on another page
+        for entry in entries:
+            if self.indexes.get(entry.Index) is entry:
+                del self.indexes[entry.Index]
+            if self.names.get(entry.Name) is entry:
+                del self.names[entry.Name]
+
+    # =================================================================
+    # Lookups, no round trip
+
+    @property
+    def entries(self):
+        return [entry for page in sorted(self.pages)
+                for entry in self.pages[page][1]]
+
+    def by_index(self, index):
+        return self.indexes.get(index)
+
+    def by_name(self, name):
+        return self.names.get(name)
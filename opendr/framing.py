@@ -0,0 +1,139 @@
+from construct import Container
+
+from .decode import header_format
+
+# =====================================================================
+# Receive buffer, packets are handed out as views into one preallocated
+# bytearray so bulk data (streaming/downloads) is not copied per packet.
+# Anything that does not frame is skipped up to the next b"DR" that does.
+
+# Longest long packet body seen is 0x56a (FileData), a header giving more
+# is taken as corrupt rather than waited on for up to 64KB
+max_length = 0x800
+
+class PacketBuffer(object):
+    def __init__(self, size=0x40000):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.start = 0
+        self.end = 0
+
+        self.resyncs = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.undecoded = 0  # framed, but dropped by the decoder
+
+    def __len__(self):
+        return self.end - self.start
+
+    def clear(self):
+        self.start = 0
+        self.end = 0
+
+    def reserve(self, size):
+        # Only the (partial) packet at the head is ever moved, previously
+        # returned packet views are no longer valid after this
+        if len(self.data) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+        if pending + size > len(self.data):
+            data = bytearray(max(2 * len(self.data), pending + size))
+            data[:pending] = self.view[self.start:self.end]
+            self.data = data
+            self.view = memoryview(data)
+        elif pending:
+            self.view[:pending] = self.view[self.start:self.end]
+
+        self.start = 0
+        self.end = pending
+
+    def writable(self, size=0x10000):
+        # Free space to receive into, followed by written()
+        self.reserve(size)
+        return self.view[self.end:]
+
+    def written(self, length):
+        self.end += length
+
+    def recv_into(self, sock, size=0x10000):
+        length = sock.recv_into(self.writable(size), size)
+        self.written(length)
+        return length
+
+    def feed(self, data):
+        self.reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def valid(self, position):
+        # Magic, and the flags seen so far all have the low nibble clear
+        data = self.data
+        return data[position] == 0x44 and data[position + 1] == 0x52 and \
+            not data[position + 2] & 0x0f
+
+    def resync(self, position):
+        # Skips to the next candidate header after 'position', returns
+        # False if there is none yet (the last byte may start the magic)
+        self.resyncs += 1
+        found = self.data.find(b"DR", position + 1, self.end)
+        while found >= 0 and found + 3 <= self.end and not self.valid(found):
+            found = self.data.find(b"DR", found + 1, self.end)
+        if found < 0:
+            found = self.end - 1
+        self.skipped += found - self.start
+        self.start = found
+        return self.end - self.start >= 14
+
+    def packets(self):
+        # Yields (header, packet) for each complete packet in the buffer,
+        # which is not to be fed meanwhile. The header is unpacked once
+        # and checked here, the same as valid()/parse_header()
+        data = self.data
+        view = self.view
+        unpack = header_format.unpack_from
+        while True:
+            start = self.start
+            end = self.end
+            if end - start < 14:
+                break
+            magic, flags, length = unpack(data, start)
+            if magic != b"DR" or flags & 0x0f:
+                if not self.resync(start):
+                    break
+                continue
+
+            if flags & 0x40:
+                if length > max_length:
+                    if not self.resync(start):
+                        break
+                    continue
+                size = 14 + length
+                if end - start < size:
+                    break
+
+                # A long packet should be followed by the next header, if
+                # not and there is one inside it, it was cut short
+                after = start + size
+                if end - after >= 3 and not self.valid(after):
+                    inside = data.find(b"DR", start + 14, after)
+                    while inside >= 0 and not self.valid(inside):
+                        inside = data.find(b"DR", inside + 1, after)
+                    if inside >= 0:
+                        self.truncated += 1
+                        self.skipped += inside - start
+                        self.start = inside
+                        continue
+            else:
+                size = 14
+
+            self.start = start + size
+            if self.start == end:
+                self.start = self.end = 0
+            yield Container(Flags=Container(Long=flags >> 6 & 1),
+                            length=length), view[start:start + size]
+
+    def report(self):
+        return "%d resyncs, %d bytes skipped, %d truncated packets, " \
+            "%d undecoded" % (self.resyncs, self.skipped, self.truncated,
+                              self.undecoded)
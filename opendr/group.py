@@ -0,0 +1,127 @@
+import time
+import asyncio
+
+from . import encoder
+from .client import DRClient
+
+# =====================================================================
+# Several recorders from one event loop. Keycodes are written to every
+# recorder back to back in one go, and the skew is measured from when
+# each recorder's Status update (0x2020/0x00) arrives. VU and counter
+# updates from all of them are merged.
+
+RECORD = 0x0b
+STOP = 0x08
+MARK = 0x18
+
+def name(client):
+    return "%s:%d" % (client.host, client.port)
+
+def status_match(seen):
+    def match(log, packet):
+        if packet[2:5] == b"\x20\x20\x00":
+            seen.append(time.perf_counter())
+            return True
+        return False
+    return match
+
+
+class Group(object):
+    def __init__(self, hosts, port=8010, timeout=5.0):
+        # 'hosts' are addresses, or address:port
+        self.clients = []
+        for host in hosts:
+            host, sep, host_port = host.partition(":")
+            self.clients.append(DRClient(host, host_port or port, timeout))
+        self.vu = {}
+        self.counter = {}
+        self.status = {}
+
+    async def connect(self, settle=1.0):
+        await asyncio.gather(*[client.connect(settle)
+                               for client in self.clients])
+        return self
+
+    async def close(self):
+        await asyncio.gather(*[client.close() for client in self.clients])
+
+    async def keycode(self, keycode, timeout=2.0):
+        # Returns [(name, sent, latency, skew, status)] in seconds, 'sent'
+        # from the first write, 'latency' from the write to the Status
+        # update and 'skew' from the first Status update to arrive
+        data = encoder.keycode(keycode)
+        seen = [[] for client in self.clients]
+        futures = [client.expect(status_match(times))
+                   for client, times in zip(self.clients, seen)]
+
+        sent = []
+        for client in self.clients:
+            sent.append(time.perf_counter())
+            client.send(data)
+            client.flush()
+
+        done, pending = await asyncio.wait(futures, timeout=timeout)
+        for client, future in zip(self.clients, futures):
+            client.forget(future)
+
+        first = min([times[0] for times in seen if times] or [None])
+        results = []
+        for client, when, times, future in zip(self.clients, sent, seen,
+                                               futures):
+            if future in done and future.exception() is None:
+                log, packet = future.result()
+                status = log.Short.Update.Status
+                self.status[name(client)] = status
+                results.append((name(client), when - sent[0], times[0] - when,
+                                times[0] - first, status))
+            else:
+                results.append((name(client), when - sent[0], None, None,
+                                None))
+        return results
+
+    # =================================================================
+    # Merged updates
+
+    async def updates(self):
+        # Yields (name, log) for every recorder's updates, keeping the
+        # latest VU, counter and status of each
+        queue = asyncio.Queue()
+
+        async def follow(client):
+            async for log in client.updates():
+                queue.put_nowait((name(client), log))
+            queue.put_nowait((name(client), None))
+
+        tasks = [asyncio.ensure_future(follow(client))
+                 for client in self.clients]
+        try:
+            running = len(tasks)
+            while running:
+                host, log = await queue.get()
+                if log is None:
+                    running -= 1
+                    continue
+                update = log.get('Short') and log.Short.get('Update')
+                if update:
+                    if update.get('VUMeters') is not None:
+                        self.vu[host] = update
+                    elif update.get('Counter') is not None:
+                        self.counter[host] = update.Counter
+                    elif update.get('Status') is not None:
+                        self.status[host] = update.Status
+                yield host, log
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def summary(self):
+        lines = []
+        for client in self.clients:
+            host = name(client)
+            vu = self.vu.get(host)
+            lines.append("%-21s %-10s %8s  VU %s %s" % (
+                host, self.status.get(host, "-"), self.counter.get(host, "-"),
+                " ".join("%3d/%-3d" % (pair.BarL, pair.BarR)
+                         for pair in vu.VUMeters) if vu else "-",
+                vu.DecimalVU if vu else ""))
+        return "\n".join(lines)
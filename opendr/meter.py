@@ -0,0 +1,126 @@
+import math
+import asyncio
+import concurrent.futures
+
+import numpy
+
+from construct import Container, ListContainer
+
+from .wavfile import stream_rates
+
+# =====================================================================
+# Level meter computed from the streamed audio (16bit stereo PCM), for
+# when the recorder's own VU updates are too coarse or too slow. Blocks
+# are measured on a worker thread, the receive side only collects them,
+# and each result goes to DRClient.updates() looking like a VU update, so
+# anything showing VU shows these too: the bars are on the recorder's
+# 0..32 scale (2dB a step, full at 0dBFS, Peek set when clipped) in the
+# first pair, shown alone, and the stereo pair, shown first with --mtr,
+# DecimalVU is the peak in dBFS, and 'Levels' the measurements themselves.
+
+def design_oversampler(factor=4, taps=12):
+    # Windowed sinc interpolator, as 'factor' phases of 'taps' each
+    n = numpy.arange(factor * taps) - (factor * taps - 1) / 2.0
+    h = numpy.sinc(n / factor) * numpy.kaiser(len(n), 8.0)
+    h *= factor / h.sum()
+    return [h[phase::factor].astype(numpy.float32)
+            for phase in range(factor)]
+
+oversampler = design_oversampler()
+
+def decibels(value):
+    return 20 * math.log10(max(value, 1e-10))
+
+def bar(db):
+    # As the recorder's bars, 0..32
+    return int(min(32, max(0, round((db + 64) / 2))))
+
+
+class StreamMeter(object):
+    def __init__(self, client, block=1024):
+        # 'block' is frames measured at a time, 1024 is about 21ms
+        self.client = client
+        self.block = block * 4
+        self.pending = bytearray()
+        self.offset = None
+        self.rate = None
+        self.worker = concurrent.futures.ThreadPoolExecutor(1)
+        self.history = numpy.zeros((len(oversampler[0]), 2), numpy.float32)
+
+        self.blocks = 0
+        self.clips = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            async for rate, offset, data in self.client.stream():
+                if self.offset is None:
+                    self.offset = offset
+                self.rate = rate
+                self.pending += data
+                while len(self.pending) >= self.block:
+                    block = bytes(self.pending[:self.block])
+                    del self.pending[:self.block]
+                    future = loop.run_in_executor(self.worker, self.measure,
+                                                  block)
+                    future.add_done_callback(self.publish)
+        finally:
+            self.worker.shutdown(wait=False)
+
+    # =================================================================
+    # Worker thread, one block at a time so 'history' runs on
+
+    def measure(self, block):
+        samples = numpy.frombuffer(block, "<i2").reshape(-1, 2)
+        clips = numpy.count_nonzero((samples == 32767) | (samples == -32768),
+                                    axis=0)
+        x = samples.astype(numpy.float32) / 32768.0
+        peak = numpy.abs(x).max(axis=0)
+        rms = numpy.sqrt(numpy.mean(x * x, axis=0))
+
+        # True peak, the largest of the 4x oversampled signal
+        extended = numpy.concatenate((self.history, x))
+        self.history = extended[len(extended) - len(self.history):]
+        true_peak = peak.copy()
+        for phase in oversampler:
+            for channel in range(2):
+                filtered = numpy.convolve(extended[:, channel], phase,
+                                          "valid")
+                true_peak[channel] = max(true_peak[channel],
+                                         numpy.abs(filtered).max())
+        return len(samples), peak, rms, true_peak, clips
+
+    # =================================================================
+    # Back on the event loop
+
+    def publish(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        frames, peak, rms, true_peak, clips = future.result()
+        self.blocks += 1
+        self.clips += int(clips.sum())
+
+        peak_db = [decibels(value) for value in peak]
+        stereo = Container(Peek=int(clips.any()), BarL=bar(peak_db[0]),
+                           **{"12dB": 0}, BarR=bar(peak_db[1]))
+        meters = ListContainer([stereo, Container(
+            Peek=0, BarL=0, **{"12dB": 0}, BarR=0), stereo])
+        levels = Container(
+            Rate=stream_rates.get(self.rate),
+            Frames=frames,
+            Peak=peak_db,
+            RMS=[decibels(value) for value in rms],
+            TruePeak=[decibels(value) for value in true_peak],
+            Clips=[int(count) for count in clips],
+        )
+        log = Container(type=0x2020, Short=Container(type3=0x12,
+                        Update=Container(VUMeters=meters,
+                                         DecimalVU=max(-128, int(round(
+                                             max(peak_db)))),
+                                         Levels=levels)))
+        for queue in self.client.queues:
+            queue.put_nowait(log)
+
+    def report(self):
+        return "%d blocks of %d frames, %d clipped samples" % (
+            self.blocks, self.block // 4, self.clips)
@@ -0,0 +1,166 @@
+import sys
+import json
+import time
+import bisect
+import asyncio
+
+from .decode import packet_type, parse_stream_header
+
+# =====================================================================
+# Counters for a live session. DRProtocol only times and counts packets
+# when the client has a Metrics, so there is nothing to pay without one.
+# Read out as a JSON line every so often and/or Prometheus text over HTTP
+# on localhost.
+
+decode_buckets = [1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4,
+                  1e-3, 1e-2]
+read_buckets = [64, 256, 1024, 4096, 16384, 65536]
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics(object):
+    def __init__(self):
+        self.started = time.time()
+        self.packets = {}  # type : [count, bytes]
+        self.decode = {}   # type : Histogram
+        self.reads = Histogram(read_buckets)
+        self.stream_next = None
+        self.stream_gaps = 0
+        self.stream_missing = 0
+        self.client = None
+
+    def attach(self, client):
+        client.metrics = self
+        self.client = client
+        return self
+
+    # =================================================================
+    # Called by DRProtocol
+
+    def read(self, nbytes):
+        self.reads.add(nbytes)
+
+    def packet(self, packet, elapsed):
+        kind = packet_type(packet)
+        counts = self.packets.get(kind)
+        if counts is None:
+            counts = self.packets[kind] = [0, 0]
+            self.decode[kind] = Histogram(decode_buckets)
+        counts[0] += 1
+        counts[1] += len(packet)
+        self.decode[kind].add(elapsed)
+
+        if kind == "f020:20":
+            rate, offset = parse_stream_header(packet)
+            if self.stream_next is not None and offset > self.stream_next:
+                self.stream_gaps += 1
+                self.stream_missing += offset - self.stream_next
+            self.stream_next = offset + (len(packet) - 14) // 4
+
+    # =================================================================
+    # Read out
+
+    def gauges(self):
+        values = {}
+        client = self.client
+        if client is not None and client.writer is not None:
+            writer = client.writer
+            values["writer_queue_depth"] = writer.full.qsize()
+            values["writer_queue_depth_max"] = writer.depth
+            values["writer_stalls"] = writer.stalls
+            values["writer_stall_seconds_max"] = writer.max_stall
+        if client is not None and client.buffer is not None:
+            values["framing_resyncs"] = client.buffer.resyncs
+            values["framing_skipped_bytes"] = client.buffer.skipped
+            values["framing_truncated"] = client.buffer.truncated
+            values["framing_undecoded"] = client.buffer.undecoded
+        values["stream_gaps"] = self.stream_gaps
+        values["stream_missing_frames"] = self.stream_missing
+        return values
+
+    def snapshot(self):
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "packets": dict((kind, {
+                "count": count, "bytes": nbytes,
+                "decode_mean_us": self.decode[kind].sum / count * 1e6})
+                for kind, (count, nbytes) in sorted(self.packets.items())),
+            "reads": {"count": self.reads.count, "bytes": self.reads.sum},
+            "gauges": self.gauges(),
+        }
+
+    def prometheus(self):
+        lines = [
+            "# TYPE opendr_packets_total counter",
+            "# TYPE opendr_packet_bytes_total counter",
+        ]
+        for kind, (count, nbytes) in sorted(self.packets.items()):
+            lines.append('opendr_packets_total{type="%s"} %d' % (kind, count))
+            lines.append('opendr_packet_bytes_total{type="%s"} %d' %
+                         (kind, nbytes))
+
+        lines.append("# TYPE opendr_decode_seconds histogram")
+        for kind, histogram in sorted(self.decode.items()):
+            for bound, total in histogram.cumulative():
+                lines.append('opendr_decode_seconds_bucket{type="%s",le="%s"} '
+                             '%d' % (kind, bound, total))
+            lines.append('opendr_decode_seconds_sum{type="%s"} %.9f' %
+                         (kind, histogram.sum))
+            lines.append('opendr_decode_seconds_count{type="%s"} %d' %
+                         (kind, histogram.count))
+
+        lines.append("# TYPE opendr_read_bytes histogram")
+        for bound, total in self.reads.cumulative():
+            lines.append('opendr_read_bytes_bucket{le="%s"} %d' %
+                         (bound, total))
+        lines.append("opendr_read_bytes_sum %d" % self.reads.sum)
+        lines.append("opendr_read_bytes_count %d" % self.reads.count)
+
+        for name, value in sorted(self.gauges().items()):
+            lines.append("# TYPE opendr_%s gauge" % name)
+            lines.append("opendr_%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+    async def log(self, interval=10.0, out=None):
+        # A JSON line every 'interval' seconds
+        out = out or sys.stdout
+        while True:
+            await asyncio.sleep(interval)
+            out.write(json.dumps(self.snapshot()) + "\n")
+            out.flush()
+
+    async def serve(self, port=9100, host="127.0.0.1"):
+        # Prometheus text for any request
+        async def handle(reader, writer):
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                pass
+            body = self.prometheus().encode("utf8")
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        async with server:
+            await server.serve_forever()
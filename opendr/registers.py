@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import binascii
+
+from .decode import parse_short
+from .scheduler import Scheduler
+
+# =====================================================================
+# Local copy of the recorder's settings, kept as the raw 14 byte
+# responses. It follows the unsolicited 0x3020 (register) and ScreenInfo
+# updates while attached to a client, and is saved per recorder (its
+# address, identical units give identical SysInfo) and model/firmware so
+# the next connection only reads what is missing or old.
+
+settings = tuple(
+    [(0x01, reg) for reg in range(0x00, 0x0a)] +
+    [(0x02, reg) for reg in range(0x00, 0x06)] +
+    [(0x0a, 0x02), (0x0a, 0x03), (0x0b, 0x00)])
+
+def unit_name(client):
+    # For the saved copies, one recorder from another
+    return "%s_%d" % (client.host, client.port)
+
+
+class RegisterCache(object):
+    def __init__(self, path="~/.opendr", max_age=3600.0):
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+        self.name = None
+        self.sys_info = None
+        self.registers = {}  # (bank, reg) : [time, packet]
+        self.screen = {}     # type4 : [time, packet]
+        self.changed = False
+
+    # =================================================================
+    # Persistence, one file per recorder address and SysInfo
+    # name/version/build
+
+    def filename(self):
+        return os.path.join(self.path, "registers-%s.json" % self.name)
+
+    def load(self, sys_info, unit=None):
+        # 'unit' tells recorders apart, see unit_name()
+        self.sys_info = sys_info
+        self.name = "%s-%d-%d" % (sys_info.Name.strip(), sys_info.Version,
+                                  sys_info.Build)
+        if unit:
+            self.name += "-" + unit
+        self.registers = {}
+        self.screen = {}
+        try:
+            with open(self.filename()) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            return self
+
+        for key, (when, packet) in saved.get("registers", {}).items():
+            bank, reg = binascii.unhexlify(key)
+            self.registers[(bank, reg)] = [when, binascii.unhexlify(packet)]
+        for key, (when, packet) in saved.get("screen", {}).items():
+            self.screen[int(key, 16)] = [when, binascii.unhexlify(packet)]
+        return self
+
+    def save(self):
+        if self.name is None or not self.changed:
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        saved = {
+            "registers": dict(("%02x%02x" % address, [when, packet.hex()])
+                              for address, (when, packet) in
+                              self.registers.items()),
+            "screen": dict(("%02x" % type4, [when, packet.hex()])
+                           for type4, (when, packet) in self.screen.items()),
+        }
+        temp = self.filename() + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(saved, f, indent=1, sort_keys=True)
+        os.replace(temp, self.filename())
+        self.changed = False
+
+    # =================================================================
+    # Kept up to date by DRClient.dispatch(), for every short packet
+
+    def update(self, packet):
+        if packet[2] == 0x30 and packet[3] in (0x20, 0xa5):
+            self.registers[(packet[4], packet[5])] = [time.time(),
+                                                      bytes(packet)]
+            self.changed = True
+        elif packet[2:5] == b"\x20\x20\x20":
+            self.screen[packet[5]] = [time.time(), bytes(packet)]
+            self.changed = True
+
+    # =================================================================
+    # Reading, no round trip
+
+    def __contains__(self, address):
+        return address in self.registers
+
+    def get(self, bank, reg):
+        # Decoded register (as DRClient.read_register), None if the
+        # recorder reported it as not valid, KeyError if never read
+        when, packet = self.registers[(bank, reg)]
+        if packet[3] == 0xa5:
+            return None
+        return parse_short(packet).Short
+
+    def get_screen(self, type4):
+        when, packet = self.screen[type4]
+        return parse_short(packet).Short.Update
+
+    def age(self, bank, reg):
+        return time.time() - self.registers[(bank, reg)][0]
+
+    def stale(self, addresses=settings):
+        now = time.time()
+        return [address for address in addresses
+                if address not in self.registers or
+                now - self.registers[address][0] > self.max_age]
+
+    # =================================================================
+    # Attaching to a client
+
+    async def attach(self, client, addresses=settings, window=4):
+        # Load the saved copy for this recorder, follow its updates and
+        # read the stale entries, returns the Scheduler for its report()
+        self.load(await client.sys_info(), unit_name(client))
+        client.registers = self
+        return await self.refresh(client, addresses, window)
+
+    async def refresh(self, client, addresses=settings, window=4):
+        scheduler = Scheduler(client, window)
+        for bank, reg in self.stale(addresses):
+            scheduler.register(bank, reg)
+        await scheduler.run()
+        self.save()
+        return scheduler
@@ -0,0 +1,226 @@
+import re
+import mmap
+import struct
+import asyncio
+import binascii
+
+from .client import DRProtocol
+from .framing import PacketBuffer
+from .session import SessionReader, capture_file, RECEIVED, SENT
+
+# =====================================================================
+# Captures of real sessions (see pcap/), either the tshark text dumps or
+# the libpcap files themselves, fed back through the client
+
+hex_run = re.compile(r"[0-9a-f]{2}(:[0-9a-f]{2})*:?")
+
+def read_capture(filename, source="192.168.1.1"):
+    # Returns the TCP payloads sent by 'source' in a tshark text dump
+    # (see README), payloads may be continued over several lines and the
+    # dumps are annotated by hand, so anything else is skipped
+    segments = []
+    current = None
+    with open(filename) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0].isdigit():
+                current = None
+                if len(fields) >= 5 and fields[1] == source:
+                    found = hex_run.match(fields[4])
+                    if found:
+                        current = [found.group(0)]
+                        segments.append(current)
+            elif current is not None and not fields[0] and len(fields) > 1:
+                found = hex_run.match(fields[1])
+                if found:
+                    current.append(found.group(0))
+            else:
+                current = None
+
+    return [binascii.unhexlify("".join(c).replace(":", "")) for c in segments]
+
+pcap_magic = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+ip_header = struct.Struct(">BxHxxxxxBxx4s4s")
+tcp_header = struct.Struct(">HHI4xBB")
+
+def pcap_frames(filename):
+    # Yields (timestamp, IPv4 packet) from a libpcap file, as views into
+    # the mmap'ed file. Ethernet (with or without a VLAN tag), Linux
+    # cooked (tcpdump -i any, as on Android) and raw IP link types
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:4] not in pcap_magic:
+        raise ValueError("%s is not a pcap file" % filename)
+    endian, scale = pcap_magic[data[:4]]
+    linktype = struct.unpack_from(endian + "I", data, 20)[0]
+    if linktype not in (1, 101, 113):
+        raise ValueError("%s: unsupported link type %d" % (filename, linktype))
+
+    view = memoryview(data)
+    record = struct.Struct(endian + "IIII")
+    offset = 24
+    end = len(data)
+    while offset + 16 <= end:
+        seconds, fraction, length, original = record.unpack_from(data, offset)
+        offset += 16
+        frame = offset
+        offset += length
+        if offset > end:
+            break
+
+        if linktype == 1:
+            ether = 14
+            if data[frame + 12:frame + 14] == b"\x81\x00":
+                ether = 18
+            kind = data[frame + ether - 2:frame + ether]
+        elif linktype == 113:
+            ether = 16
+            kind = data[frame + 14:frame + 16]
+        else:
+            ether = 0
+            kind = b"\x08\x00"
+        if kind == b"\x08\x00" and length >= ether + 20:
+            yield seconds + fraction * scale, view[frame + ether:offset]
+
+class TCPStream(object):
+    # One direction of a connection, put back in sequence order.
+    # Retransmitted data is dropped, early segments are held until the
+    # gap is filled, or skipped over if it never is (the framing will
+    # resync after a segment missing from the capture)
+    def __init__(self, hold=64):
+        self.next = None
+        self.early = {}  # seq : (timestamp, payload)
+        self.hold = hold
+        self.skipped = 0
+
+    def segment(self, timestamp, seq, syn, payload):
+        # Returns [(timestamp, payload)] now in sequence
+        if syn:
+            self.next = (seq + 1) & 0xffffffff
+            self.early = {}
+        if not payload:
+            return []
+        if self.next is None:
+            self.next = seq
+        self.early[seq] = (timestamp, payload)
+
+        ready = []
+        while self.early:
+            for seq in self.early:
+                # Signed distance from what is expected next
+                ahead = (seq - self.next + 0x80000000 & 0xffffffff) - \
+                    0x80000000
+                if ahead <= 0:
+                    break
+            else:
+                if len(self.early) <= self.hold:
+                    break
+                seq = min(self.early, key=lambda seq: (seq - self.next) &
+                          0xffffffff)
+                ahead = (seq - self.next) & 0xffffffff
+                self.skipped += ahead
+                self.next = seq
+
+            timestamp, payload = self.early.pop(seq)
+            if ahead < 0:
+                payload = payload[-ahead:]
+            if payload:
+                ready.append((timestamp, payload))
+                self.next = (self.next + len(payload)) & 0xffffffff
+        return ready
+
+def tcp_segments(filename, device="192.168.1.1", port=8010):
+    # Yields (timestamp, direction, payload) for the TCP connections to
+    # 'device':'port' in a libpcap file, each direction reassembled,
+    # direction is session.RECEIVED for what the device sent
+    address = bytes(int(x) for x in device.split("."))
+    streams = {}
+    for timestamp, ip in pcap_frames(filename):
+        version, total, protocol, source, destination = \
+            ip_header.unpack_from(ip)
+        if protocol != 6 or version >> 4 != 4:
+            continue
+        header = (version & 0x0f) * 4
+        if len(ip) < header + 20:
+            continue
+        sport, dport, seq, offset, flags = tcp_header.unpack_from(ip, header)
+        if source == address and sport == port:
+            direction = RECEIVED
+        elif destination == address and dport == port:
+            direction = SENT
+        else:
+            continue
+
+        key = (source, sport, destination, dport)
+        stream = streams.get(key)
+        if stream is None:
+            stream = streams[key] = TCPStream()
+        payload = ip[header + (offset >> 4) * 4:total or len(ip)]
+        for timestamp, payload in stream.segment(timestamp, seq,
+                                                 flags & 0x02, payload):
+            yield timestamp, direction, payload
+
+def read_pcap(filename, source="192.168.1.1"):
+    # Returns (timestamp, payload) for the TCP stream sent by 'source',
+    # either the recorder or the phone/tablet controlling it
+    if source == "192.168.1.1":
+        return [(timestamp, payload) for timestamp, direction, payload
+                in tcp_segments(filename) if direction == RECEIVED]
+    return [(timestamp, payload) for timestamp, direction, payload
+            in tcp_segments(filename) if direction == SENT]
+
+def pcap_packets(filename, direction=RECEIVED, device="192.168.1.1"):
+    # Yields (timestamp, header, packet) framed straight from a pcap,
+    # the packet views are only valid until the next one
+    buffer = PacketBuffer()
+    for timestamp, segment_direction, payload in tcp_segments(filename,
+                                                              device):
+        if segment_direction == direction:
+            buffer.feed(payload)
+            for header, packet in buffer.packets():
+                yield timestamp, header, packet
+
+def load_capture(filename, source="192.168.1.1", seconds=None):
+    # (timestamp, payload) for any kind of capture, the text dumps have
+    # no timestamps, session captures (see session.py) can start part way
+    if capture_file(filename):
+        return SessionReader(filename).segments(seconds)
+    with open(filename, "rb") as f:
+        magic = f.read(4)
+    if magic in pcap_magic:
+        return read_pcap(filename, source)
+    return [(None, data) for data in read_capture(filename, source)]
+
+async def replay(client, segments, speed=0):
+    # Push captured segments through the same protocol (framing) and
+    # client dispatch as a live connection, at 'speed' times the
+    # captured rate or as fast as possible when 0
+    protocol = DRProtocol(client)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first = None
+
+    for timestamp, data in segments:
+        if speed and timestamp is not None:
+            if first is None:
+                first = timestamp
+            delay = start + (timestamp - first) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+
+        data = memoryview(data)
+        while data:
+            view = protocol.get_buffer(len(data))
+            length = min(len(view), len(data))
+            view[:length] = data[:length]
+            protocol.buffer_updated(length)
+            data = data[length:]
+
+    protocol.connection_lost(None)
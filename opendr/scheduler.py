@@ -0,0 +1,100 @@
+import time
+import asyncio
+
+from .encoder import register_read
+from .client import register_match, reply_match
+
+# =====================================================================
+# Batches of requests kept in flight together, rather than one round
+# trip each. Responses are matched to their request by bank/register or
+# reply type, so no two requests with the same key are out at once.
+
+class Job(object):
+    def __init__(self, name, command, match, key, register=False):
+        self.name = name
+        self.command = command
+        self.match = match
+        self.key = key
+        self.register = register
+
+        self.value = None
+        self.packet = None  # the response as received
+        self.error = None
+        self.attempts = 0
+        self.elapsed = None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+
+class Scheduler(object):
+    def __init__(self, client, window=4, timeout=1.0, retries=2):
+        # 'window' is requests in flight, or an asyncio.Semaphore shared
+        # with other schedulers
+        self.client = client
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.jobs = []
+
+    def register(self, bank, reg, name=None):
+        # Value is log.Short, or None if the register is not valid (0xa5)
+        job = Job(name or "%02x:%02x" % (bank, reg),
+                  register_read(bank, reg),
+                  register_match(bank, reg), (0x30, bank, reg), True)
+        self.jobs.append(job)
+        return job
+
+    def command(self, command, name=None, size=1):
+        # Value is the decoded reply, see reply_match()
+        job = Job(name or "%02x%02x:%02x" % tuple(command[2:5]), command,
+                  reply_match(command, size),
+                  (command[2],) + tuple(command[4:4 + size]))
+        self.jobs.append(job)
+        return job
+
+    async def run(self):
+        # Returns the jobs, check 'failed'/'error' on each
+        window = self.window
+        if not isinstance(window, asyncio.Semaphore):
+            window = asyncio.Semaphore(window)
+        busy = {}
+
+        async def run_job(job):
+            lock = busy.setdefault(job.key, asyncio.Lock())
+            async with lock, window:
+                start = time.perf_counter()
+                while True:
+                    job.attempts += 1
+                    try:
+                        log, packet = await self.client.request(
+                            job.command, job.match, self.timeout)
+                        break
+                    except asyncio.TimeoutError as e:
+                        if job.attempts > self.retries:
+                            job.error = e
+                            return
+                    except ConnectionError as e:
+                        job.error = e
+                        return
+                job.elapsed = time.perf_counter() - start
+
+            job.packet = bytes(packet)
+            if job.register:
+                job.value = None if packet[3] == 0xa5 else log.Short
+            else:
+                job.value = log
+
+        await asyncio.gather(*[run_job(job) for job in self.jobs])
+        return self.jobs
+
+    def report(self):
+        failed = [job for job in self.jobs if job.failed]
+        retried = sum(job.attempts - 1 for job in self.jobs)
+        text = "%d requests, %d retries, %d failed" % (
+            len(self.jobs), retried, len(failed))
+        for job in failed:
+            text += "\n  %s: %s after %d attempts" % (
+                job.name, type(job.error).__name__, job.attempts)
+        return text
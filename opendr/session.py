@@ -0,0 +1,296 @@
+import mmap
+import time
+import bisect
+import struct
+
+# =====================================================================
+# Raw session capture, every read from and write to the recorder as it
+# happened, so a field session can be looked at again without a phone and
+# wireshark. Two append-only files, both little endian and fixed layout
+# so they can be mmap'ed:
+#
+#   name.drc      header, then records of (time, direction, length) and
+#                 the bytes as they were read from/written to the socket
+#   name.drc.idx  header, then one entry per framed packet: time, offset
+#                 of the record it starts in and where in it, length,
+#                 direction and packet[2:5] (flags, type, sub type)
+#
+# Times are monotonic seconds from the start, the header has the wall
+# clock time of the start. Writes go through the client's Writer, handed
+# to its thread at least every 'interval' seconds (the recorder sends
+# something several times a second) so a session that dies leaves a
+# capture that reads up to about then.
+
+RECEIVED = 0
+SENT = 1
+
+capture_magic = b"DRCAP\x00\x01\x00"
+index_magic = b"DRIDX\x00\x01\x00"
+file_header = struct.Struct("<8sd")
+record_header = struct.Struct("<dBI")
+index_entry = struct.Struct("<dQIIB3s")
+
+def capture_file(filename):
+    with open(filename, "rb") as f:
+        return f.read(8) == capture_magic
+
+
+class SessionRecorder(object):
+    def __init__(self, filename, writer, interval=1.0):
+        self.filename = filename
+        self.writer = writer
+        self.interval = interval
+        self.data = open(filename, "wb")
+        self.index = open(filename + ".idx", "wb")
+        self.wall = time.time()
+        self.start = time.monotonic()
+        self.flushed = 0.0
+
+        # Headers straight away, the files are captures from the start
+        for f, magic in ((self.data, capture_magic),
+                         (self.index, index_magic)):
+            f.write(file_header.pack(magic, self.wall))
+            f.flush()
+        self.position = file_header.size
+        self.entries = file_header.size
+        self.pending = bytearray()
+
+        # Receive side reads still (partly) in the PacketBuffer, as
+        # (stream position, record offset), to find where packets start
+        self.received = 0
+        self.chunks = []
+        self.now = 0.0
+
+        self.records = 0
+        self.packets = 0
+
+    def record(self, direction, data):
+        # Returns the offset of the data in the capture
+        now = time.monotonic() - self.start
+        self.writer.write(self.data, self.position,
+                          record_header.pack(now, direction, len(data)))
+        self.writer.write(self.data, self.position + record_header.size,
+                          data)
+        offset = self.position + record_header.size
+        self.position = offset + len(data)
+        self.records += 1
+        if now - self.flushed >= self.interval:
+            self.flush()
+        return now, offset
+
+    def entry(self, now, offset, skip, packet, direction):
+        # Entries are collected so they do not split up the Writer's
+        # coalescing of the capture itself
+        self.pending += index_entry.pack(now, offset, skip, len(packet),
+                                         direction, bytes(packet[2:5]))
+        self.packets += 1
+        if len(self.pending) >= 0x8000:
+            self.flush()
+
+    def flush(self):
+        # Index entries go after the data they point into
+        if self.pending:
+            self.writer.write(self.index, self.entries, self.pending)
+            self.entries += len(self.pending)
+            self.pending = bytearray()
+        self.writer.submit(self.data)
+        self.writer.submit(self.index)
+        self.flushed = time.monotonic() - self.start
+
+    # =================================================================
+    # Called by DRProtocol and DRClient.flush()
+
+    def read(self, data):
+        now, offset = self.record(RECEIVED, data)
+        self.chunks.append((self.received, offset))
+        self.received += len(data)
+        self.now = now
+
+    def packet(self, packet, pending):
+        # A framed packet, 'pending' is what is left in the buffer after it
+        start = self.received - pending - len(packet)
+        chunks = self.chunks
+        i = bisect.bisect_right(chunks, (start, 1 << 64)) - 1
+        if i > 0:
+            del chunks[:i]
+        position, offset = chunks[0]
+        self.entry(self.now, offset, start - position, packet, RECEIVED)
+
+    def sent(self, data):
+        now, offset = self.record(SENT, data)
+        self.entry(now, offset, 0, data, SENT)
+
+    def close(self):
+        self.flush()
+        self.writer.sync()
+        self.data.close()
+        self.index.close()
+
+    def report(self):
+        return "%s: %d records, %d packets, %.1f MB in %.1f s" % (
+            self.filename, self.records, self.packets, self.position / 1e6,
+            time.monotonic() - self.start)
+
+
+class IndexEntry(object):
+    __slots__ = ("time", "offset", "skip", "length", "direction", "kind")
+
+    def __init__(self, time, offset, skip, length, direction, kind):
+        self.time = time
+        self.offset = offset
+        self.skip = skip
+        self.length = length
+        self.direction = direction
+        self.kind = kind
+
+
+class SessionReader(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = self.map(filename, capture_magic)
+        self.index = self.map(filename + ".idx", index_magic)
+        self.wall = file_header.unpack_from(self.data)[1]
+
+    def map(self, filename, magic):
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:8] != magic:
+            raise ValueError("%s is not a session capture" % filename)
+        return mapped
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    # =================================================================
+    # Index, a sequence of IndexEntry in time order
+
+    def __len__(self):
+        # A capture cut short may end part way through an entry
+        return (len(self.index) - file_header.size) // index_entry.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return IndexEntry(*index_entry.unpack_from(
+            self.index, file_header.size + i * index_entry.size))
+
+    def time(self, i):
+        return struct.unpack_from("<d", self.index,
+                                  file_header.size + i * index_entry.size)[0]
+
+    def seek(self, seconds):
+        # First index entry at or after 'seconds' from the start
+        class Times(object):
+            def __len__(times):
+                return len(self)
+            def __getitem__(times, i):
+                return self.time(i)
+        return bisect.bisect_left(Times(), seconds)
+
+    def entries(self):
+        # The whole index as a NumPy structured array over the mapping,
+        # to be let go of before close()
+        import numpy
+
+        return numpy.frombuffer(self.index, numpy.dtype([
+            ("time", "<f8"), ("offset", "<u8"), ("skip", "<u4"),
+            ("length", "<u4"), ("direction", "u1"), ("kind", "u1", (3,))]),
+            len(self), file_header.size)
+
+    def find(self, kind, direction=RECEIVED, start=0):
+        # Index numbers of packets whose bytes [2:5] start with 'kind',
+        # eg. b"\x20\x20\x12" for VU updates
+        entries = self.entries()[start:]
+        found = entries["direction"] == direction
+        for i, byte in enumerate(kind):
+            found &= entries["kind"][:, i] == byte
+        del entries
+        for i in found.nonzero()[0]:
+            yield start + int(i)
+
+    def types(self):
+        # Packet counts by (direction, bytes [2:5])
+        import numpy
+
+        entries = self.entries()
+        kind = entries["kind"].astype(numpy.uint32)
+        keys = entries["direction"].astype(numpy.uint32) << 24 | \
+            kind[:, 0] << 16 | kind[:, 1] << 8 | kind[:, 2]
+        del entries, kind
+        counts = {}
+        for key, count in zip(*numpy.unique(keys, return_counts=True)):
+            key = int(key)
+            counts[(key >> 24, (key & 0xffffff).to_bytes(3, "big"))] = \
+                int(count)
+        return counts
+
+    # =================================================================
+    # Capture
+
+    def records(self, offset=file_header.size):
+        # Yields (time, direction, data offset, length) from the record
+        # at 'offset', stopping at a record cut short
+        data = self.data
+        end = len(data)
+        while offset + record_header.size <= end:
+            now, direction, length = record_header.unpack_from(data, offset)
+            offset += record_header.size
+            if offset + length > end:
+                return
+            yield now, direction, offset, length
+            offset += length
+
+    def packet(self, i):
+        # The bytes of a packet, which may be over several reads
+        entry = self[i]
+        view = memoryview(self.data)
+        data = view[entry.offset + entry.skip:entry.offset + entry.skip +
+                    entry.length]
+        if entry.skip + entry.length <= record_header.unpack_from(
+                self.data, entry.offset - record_header.size)[2]:
+            return bytes(data)
+
+        parts = []
+        needed = entry.length
+        skip = entry.skip
+        for now, direction, offset, length in self.records(
+                entry.offset - record_header.size):
+            if direction != entry.direction:
+                continue
+            parts.append(view[offset + skip:offset + min(length,
+                                                         skip + needed)])
+            needed -= len(parts[-1])
+            skip = 0
+            if not needed:
+                break
+        return b"".join(parts)
+
+    def segments(self, seconds=None, direction=RECEIVED):
+        # (time, data) as read from the socket, for replay(), optionally
+        # from the first packet at or after 'seconds'
+        offset = file_header.size
+        skip = 0
+        if seconds:
+            i = self.seek(seconds)
+            while i < len(self) and self[i].direction != direction:
+                i += 1
+            if i == len(self):
+                return
+            entry = self[i]
+            offset = entry.offset - record_header.size
+            skip = entry.skip
+
+        view = memoryview(self.data)
+        for now, record_direction, start, length in self.records(offset):
+            if record_direction == direction:
+                yield now, view[start + skip:start + length]
+                skip = 0
+
+    def report(self):
+        return "%s: %d packets, %.1f MB, %.1f s from %s" % (
+            self.filename, len(self), len(self.data) / 1e6,
+            self.time(len(self) - 1) if len(self) else 0.0,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.wall)))
@@ -0,0 +1,362 @@
+import math
+import struct
+import asyncio
+import datetime
+
+# =====================================================================
+# Stand-in for a DR-22WL/DR-44WL, answering the commands the client
+# sends and producing the unsolicited traffic seen in the captures, at
+# rates that can be set well above the real device's
+
+STOPPED = 0x10
+PLAYING = 0x11
+RECORD = 0x81
+ARMED = 0x82
+
+# Registers as read from a DR-22WL, value bytes 6..13 of the response,
+# anything missing is answered with 0xa5 (register not valid)
+registers_22 = {
+    0x0100: b"\x00\x03", 0x0101: b"\x00\x01", 0x0102: b"\x00\x00",
+    0x0108: b"\x00\x01", 0x0109: b"\x00\x00",
+    0x0200: b"\x00\x00", 0x0201: b"\x00\x00", 0x0202: b"\x00\x00",
+    0x0203: b"\x00\x00", 0x0204: b"\x00\x09",
+    0x0303: b"\x00\x00\x00\x01",
+    0x0600: b"\x00\x00", 0x0601: b"\x00\x00", 0x0602: b"\x00\x00",
+    0x0603: b"\x00\x00",
+    0x0a02: b"\x00\x00\x00\x01", 0x0a03: b"\x00\x00\x00\x02",
+    0x0b00: b"\x5a\x00\x00\x00\x5a\x00\x00\x00",
+}
+
+registers_44 = dict(registers_22)
+registers_44.update({
+    0x0103: b"\x00\x00", 0x0104: b"\x00\x00", 0x0105: b"\x00\x00",
+    0x0106: b"\x00\x00", 0x0107: b"\x00\x00", 0x0205: b"\x00\x00",
+})
+
+# Screen info (0x2020/0x20/type4) values
+screen_defaults = {
+    0x00: 0x00, 0x01: 0x00, 0x02: 0x00, 0x03: 0x01, 0x04: 0x00, 0x05: 0x04,
+    0x07: 0x05, 0x09: 0x00, 0x0a: 0x00, 0x0b: 0x00, 0x0e: 0x00, 0x0f: 0x00,
+}
+
+def fat_datetime(when):
+    date = ((when.year - 1980) << 9) | (when.month << 5) | when.day
+    time = (when.hour << 11) | (when.minute << 5) | (when.second // 2)
+    return date, time
+
+def pack_short(body):
+    # Pad to the nominal 14 bytes
+    return b"DR" + body + b"\x00" * (12 - len(body))
+
+def pack_long(flags, kind, header, payload):
+    # 'header' is bytes 5..11
+    return b"DR" + bytes((flags,)) + struct.pack(">H", kind) + header + \
+        b"\x00" * (7 - len(header)) + struct.pack(">H", len(payload)) + payload
+
+
+class SimFile(object):
+    # A take on the card, 16bit stereo WAV with a 1KHz tone generated on
+    # the fly so large files cost nothing to hold
+    def __init__(self, index, name, seconds, when, rate=48000):
+        self.index = index
+        self.name = name
+        self.when = when
+        self.rate = rate
+        self.data_size = int(seconds * rate) * 4
+        self.size = 44 + self.data_size
+        self.header = b"RIFF" + struct.pack("<I", self.size - 8) + b"WAVE" + \
+            b"fmt " + struct.pack("<IHHIIHH", 16, 1, 2, rate, rate * 4, 4, 16) + \
+            b"data" + struct.pack("<I", self.data_size)
+
+        period = rate // 1000
+        tone = b"".join(struct.pack("<hh", v, v) for v in (
+            int(8000 * math.sin(2 * math.pi * i / period))
+            for i in range(period)))
+        self.block = tone * (0x10000 // len(tone) + 2)
+        self.period = len(tone)
+
+    def read(self, offset, length):
+        data = b""
+        if offset < 44:
+            data = self.header[offset:offset + length]
+            offset += len(data)
+            length -= len(data)
+        length = min(length, self.size - offset)
+        if length > 0:
+            start = (offset - 44) % self.period
+            while length > 0:
+                chunk = self.block[start:start + length]
+                data += chunk
+                length -= len(chunk)
+                start = 0
+        return data
+
+
+class Simulator(object):
+    def __init__(self, model="DR-22WL", files=20, seconds=60,
+                 vu_rate=10.0, counter_rate=1.0, ready_rate=3.0,
+                 stream_rate=None, block=0x568):
+        self.model = model
+        self.vu_rate = vu_rate
+        self.counter_rate = counter_rate
+        self.ready_rate = ready_rate
+        self.block = block
+        # 48KHz 16bit stereo by default
+        self.stream_rate = stream_rate or 48000 * 4 / float(block)
+
+        if model == "DR-44WL":
+            self.registers = dict(registers_44)
+        else:
+            self.registers = dict(registers_22)
+        self.screen = dict(screen_defaults)
+
+        self.status = STOPPED
+        self.counter = 0
+        self.clock = None
+        self.clients = []
+
+        start = datetime.datetime(2015, 5, 19, 12, 0, 0)
+        self.files = [None]  # index 1 is the folder
+        for i in range(files):
+            when = start + datetime.timedelta(minutes=i)
+            self.files.append(SimFile(
+                i + 2, when.strftime("%y%m%d_") + "%04d.wav" % (i + 1),
+                seconds, when))
+
+    # =================================================================
+    # Responses
+
+    def status_update(self):
+        return pack_short(b"\x20\x20\x00" + bytes((self.status,)))
+
+    def counter_update(self):
+        return pack_short(b"\x20\x20\x11\x01" + struct.pack(">I", self.counter))
+
+    def vu_update(self, tick):
+        level = int(20 + 15 * math.sin(tick / 5.0)) & 0x7f
+        pairs = bytes((level, level)) * (3 if self.model == "DR-44WL" else 1)
+        return pack_short(b"\x20\x20\x12\x00" + pairs.ljust(6, b"\x00") +
+                          bytes((0xd3,)))
+
+    def register(self, bank, reg):
+        value = self.registers.get(bank << 8 | reg)
+        if value is None:
+            return pack_short(b"\x30\xa5" + bytes((bank, reg)))
+        return pack_short(b"\x30\x20" + bytes((bank, reg)) + value)
+
+    def read_update(self, type3, type4):
+        if type3 == 0x00:
+            return self.status_update()
+        elif type3 == 0x11:
+            return self.counter_update()
+        elif type3 == 0x20:
+            return pack_short(b"\x20\x20\x20" +
+                              bytes((type4, self.screen.get(type4, 0))))
+        elif type3 == 0x12:
+            return self.vu_update(0)
+        return pack_short(b"\x20\x20" + bytes((type3,)))
+
+    def sys_info(self):
+        name = self.model.encode("utf8").ljust(8, b" ")
+        return pack_long(0xf0, 0x2000, b"\x02",
+                         name + b"\x00" * 8 + struct.pack(">HHHH", 113, 69, 101, 10))
+
+    def input_info(self):
+        entry = b"\x00\x00\x00\x00" + self.registers[0x0a02][2:] + \
+            self.registers[0x0a03][2:] + b"\x00\x00"
+        count = 4 if self.model == "DR-44WL" else 2
+        return pack_long(0xf0, 0x2031, b"", entry * count)
+
+    def filename(self):
+        name = (self.files[-1].name if len(self.files) > 1 else "")
+        return pack_long(0xf0, 0x2032, b"\x00\x00\x01",
+                         name.encode("utf-16-le") + b"\x00\x00")
+
+    def file_table(self, per_packet=33):
+        entries = []
+        for f in self.files:
+            if f is None:
+                entries.append(b"\x80\x01" + b"\x00" * 8 +
+                               "DR22_0000".encode("utf-16-le") + b"\x00\x0d")
+            else:
+                date, time = fat_datetime(f.when)
+                entries.append(struct.pack(">HHHI", f.index, date, time, f.size) +
+                               f.name.encode("utf-16-le") + b"\x00\x0d")
+
+        total = struct.pack(">I", len(entries))
+        for page, i in enumerate(range(0, len(entries), per_packet)):
+            yield pack_long(0x40, 0x2010, bytes((page & 0xff,)) + total,
+                            b"".join(entries[i:i + per_packet]))
+
+    def file_data(self, f, offset=0):
+        # Blocks do not cross 32k boundaries, as on the real device
+        seq = 0
+        while offset < f.size:
+            length = min(self.block, 0x8000 - offset % 0x8000, f.size - offset)
+            yield pack_long(0x40, 0x2032,
+                            bytes((seq & 0xff,)) + struct.pack(">I", offset),
+                            f.read(offset, length))
+            offset += length
+            seq += 1
+
+    # =================================================================
+    # Connection handling
+
+    async def serve(self, host="127.0.0.1", port=8010):
+        server = await asyncio.start_server(self.connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def connection(self, reader, writer):
+        session = Session(self, writer)
+        self.clients.append(session)
+        try:
+            session.start()
+            while True:
+                command = await reader.readexactly(14)
+                await session.command(command)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            session.stop()
+            self.clients.remove(session)
+            writer.close()
+
+    def broadcast(self, data):
+        for session in self.clients:
+            session.writer.write(data)
+
+
+class Session(object):
+    def __init__(self, sim, writer):
+        self.sim = sim
+        self.writer = writer
+        self.tasks = []
+        self.streaming = None
+        self.transfer = None
+
+    def start(self):
+        sim = self.sim
+        self.writer.write(sim.status_update())
+        for rate, packet in ((sim.vu_rate, sim.vu_update),
+                             (sim.counter_rate, self.tick_counter),
+                             (sim.ready_rate, self.ready)):
+            if rate:
+                self.tasks.append(asyncio.ensure_future(
+                    self.periodic(rate, packet)))
+
+    def stop(self):
+        for task in self.tasks + [self.streaming, self.transfer]:
+            if task:
+                task.cancel()
+
+    def ready(self, tick):
+        return pack_short(b"\x20\x22\x80")
+
+    def tick_counter(self, tick):
+        if self.sim.status in (PLAYING, RECORD):
+            self.sim.counter += 1
+        return self.sim.counter_update()
+
+    async def periodic(self, rate, packet):
+        # Catches up when asyncio can not sleep short enough, so that
+        # the average rate holds at several thousand packets/s
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = 0
+        while True:
+            due = int((loop.time() - start) * rate) + 1
+            while tick < due:
+                self.writer.write(packet(tick))
+                tick += 1
+            await self.writer.drain()
+            await asyncio.sleep(max(0, start + tick / rate - loop.time()))
+
+    async def stream(self):
+        sim = self.sim
+        offset = 0
+        rate = b"\x01"  # 48KHz
+        silence = b"\x00" * sim.block
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = 0
+        while True:
+            due = int((loop.time() - start) * sim.stream_rate) + 1
+            while tick < due:
+                source = sim.files[-1] if sim.status == PLAYING and \
+                    len(sim.files) > 1 else None
+                data = source.read(44 + offset * 4, sim.block) if source \
+                    else silence
+                self.writer.write(pack_long(
+                    0xf0, 0x2020, rate + b"\x00" + struct.pack(">I", offset),
+                    data))
+                offset += len(data) // 4
+                tick += 1
+            await self.writer.drain()
+            await asyncio.sleep(max(0, start + tick / sim.stream_rate -
+                                    loop.time()))
+
+    async def download(self, f):
+        for packet in self.sim.file_data(f):
+            self.writer.write(packet)
+            await self.writer.drain()
+
+    async def command(self, command):
+        sim = self.sim
+        kind = command[2:4]
+
+        if kind == b"\x20\x42":
+            self.writer.write(sim.read_update(command[4], command[5]))
+
+        elif kind == b"\x30\x42":
+            if command[4:6] == b"\x0a\x80":
+                self.writer.write(sim.input_info())
+            else:
+                self.writer.write(sim.register(command[4], command[5]))
+
+        elif kind == b"\x30\x41":
+            address = command[4] << 8 | command[5]
+            if address == 0x0700:
+                sim.clock = command[6:13]
+            elif address in sim.registers:
+                value = sim.registers[address]
+                sim.registers[address] = command[6:6 + len(value)]
+
+        elif kind == b"\x10\x41":
+            status = {
+                0x08: STOPPED,
+                0x09: PLAYING,
+                0x0b: RECORD if sim.status == ARMED else ARMED,
+            }.get(command[5])
+            if status is not None and status != sim.status:
+                sim.status = status
+                if status == STOPPED:
+                    sim.counter = 0
+                sim.broadcast(sim.status_update())
+
+        elif kind == b"\xf0\x41":
+            if command[4:6] == b"\x00\x02":
+                self.writer.write(sim.sys_info())
+            elif command[4] == 0x32:
+                self.writer.write(sim.filename())
+            elif command[4] == 0x21:
+                self.writer.write(pack_long(0xf0, 0x2021, b"", b""))
+                if command[5] and not self.streaming:
+                    self.streaming = asyncio.ensure_future(self.stream())
+                elif not command[5] and self.streaming:
+                    self.streaming.cancel()
+                    self.streaming = None
+
+        elif kind == b"\x40\x41":
+            if command[4] == 0x10:
+                for packet in sim.file_table():
+                    self.writer.write(packet)
+            elif command[4] == 0x30:
+                index = struct.unpack(">H", command[6:8])[0]
+                if 2 <= index < len(sim.files) + 1:
+                    if self.transfer:
+                        self.transfer.cancel()
+                    self.transfer = asyncio.ensure_future(
+                        self.download(sim.files[index - 1]))
+
+        await self.writer.drain()
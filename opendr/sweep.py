@@ -0,0 +1,71 @@
+import asyncio
+import binascii
+
+from .scheduler import Scheduler
+
+# =====================================================================
+# Discovery of the register space, every bank and register 0x00-0xff.
+# Banks are read concurrently, 16 registers at a time through a Scheduler
+# so a dropped reply is asked for again, and each bank is given up on
+# after a run of 0xa5 (not valid) responses, the valid ones are written
+# as a table of 'bank:reg value' with the raw bytes following the address.
+
+async def sweep_bank(client, bank, window, run, timeout, retries, found,
+                     failed):
+    invalid = 0
+    for first in range(0, 0x100, 0x10):
+        scheduler = Scheduler(client, window, timeout, retries)
+        for reg in range(first, first + 0x10):
+            scheduler.register(bank, reg)
+        for reg, job in zip(range(first, first + 0x10),
+                            await scheduler.run()):
+            if job.failed:
+                failed.append((bank, reg))
+            elif job.value is None:
+                invalid += 1
+            else:
+                invalid = 0
+                found[(bank, reg)] = job.packet[6:14]
+        if invalid >= run:
+            return
+
+async def sweep(client, banks=range(0x100), window=32, run=16, timeout=1.0,
+                retries=2):
+    # Returns ({(bank, reg): raw value}, [(bank, reg) that timed out
+    # 'retries' + 1 times])
+    found = {}
+    failed = []
+    window = asyncio.Semaphore(window)
+    await asyncio.gather(*[sweep_bank(client, bank, window, run, timeout,
+                                      retries, found, failed)
+                           for bank in banks])
+    return found, sorted(failed)
+
+def write_table(filename, found):
+    with open(filename, "w") as f:
+        f.write("# bank:reg value\n")
+        for (bank, reg), value in sorted(found.items()):
+            f.write("%02x:%02x %s\n" % (bank, reg,
+                                        binascii.hexlify(value).decode()))
+
+def read_table(filename):
+    found = {}
+    with open(filename) as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            address, value = line.split()
+            bank, reg = address.split(":")
+            found[(int(bank, 16), int(reg, 16))] = binascii.unhexlify(value)
+    return found
+
+def diff_tables(old, new):
+    # Yields ("+"/"-"/"~", (bank, reg), old value, new value)
+    for address in sorted(set(old) | set(new)):
+        before, after = old.get(address), new.get(address)
+        if before is None:
+            yield "+", address, None, after
+        elif after is None:
+            yield "-", address, before, None
+        elif before != after:
+            yield "~", address, before, after
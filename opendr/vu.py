@@ -0,0 +1,157 @@
+import os
+import time
+import struct
+
+import numpy
+
+# =====================================================================
+# VU meter history. The VU update (0x2020/0x12) is the packet the
+# recorder sends most, so it is kept as it came, the 7 bytes after the
+# type with a timestamp, in a fixed size ring file, and only decoded, a
+# whole time range at once with NumPy, when it is looked at.
+#
+# File: header (magic, capacity, records written so far, created), then
+# 'capacity' records of vu_record, the oldest being overwritten when full.
+
+vu_magic = b"DRVU\x00\x01\x00\x00"
+vu_header = struct.Struct("<8sQQd8x")
+vu_packed = struct.Struct("<d7sx")
+vu_record = numpy.dtype([("time", "<f8"), ("raw", "u1", (7,)),
+                         ("pad", "u1")])
+
+def vu_raw(packets):
+    # (N, 7) uint8 from VU update packets
+    return numpy.frombuffer(b"".join(bytes(packet[6:13])
+                                     for packet in packets),
+                            numpy.uint8).reshape(-1, 7)
+
+def decode_vu(raw):
+    # Same fields as the vumeters BitStruct, for a (N, 7) uint8 array:
+    # (N, 3) arrays for the CH1&2, CH3&4 and Stereo pairs
+    pairs = raw[:, 0:6].reshape(-1, 3, 2)
+    left = pairs[:, :, 0]
+    right = pairs[:, :, 1]
+    return {
+        "Peek": left >> 7,
+        "BarL": left & 0x7f,
+        "12dB": right >> 7,
+        "BarR": right & 0x7f,
+        "DecimalVU": raw[:, 6].view(numpy.int8),
+    }
+
+
+class VUArchive(object):
+    def __init__(self, filename, writer, capacity=0x200000, batch=256,
+                 interval=1.0):
+        # Appends through 'writer' (see writer.py), 'batch' records or
+        # 'interval' seconds at a time, an existing archive is carried on
+        # with
+        self.filename = filename
+        self.writer = writer
+        self.batch = batch
+        self.interval = interval
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                magic, capacity, count, created = vu_header.unpack(
+                    f.read(vu_header.size))
+            if magic != vu_magic:
+                raise ValueError("%s is not a VU archive" % filename)
+            self.f = open(filename, "r+b")
+        else:
+            count = 0
+            created = time.time()
+            self.f = open(filename, "w+b")
+            # Header first, so the file is an (empty) archive from the start
+            self.f.write(vu_header.pack(vu_magic, capacity, count, created))
+            self.f.flush()
+            self.f.truncate(vu_header.size + capacity * vu_record.itemsize)
+        self.capacity = capacity
+        self.count = count
+        self.created = created
+        self.pending = bytearray()
+        self.flushed = time.time()
+
+    def update(self, packet):
+        # Called by DRClient.dispatch() for every short packet
+        if packet[2:5] == b"\x20\x20\x12":
+            now = time.time()
+            self.pending += vu_packed.pack(now, bytes(packet[6:13]))
+            if len(self.pending) >= self.batch * vu_record.itemsize or \
+                    now - self.flushed >= self.interval:
+                self.flush()
+
+    def flush(self):
+        pending = memoryview(self.pending)
+        while pending:
+            slot = self.count % self.capacity
+            length = min(len(pending),
+                         (self.capacity - slot) * vu_record.itemsize)
+            self.writer.write(self.f, vu_header.size +
+                              slot * vu_record.itemsize, pending[:length])
+            self.count += length // vu_record.itemsize
+            pending = pending[length:]
+        self.pending = bytearray()
+        self.writer.write(self.f, 0, vu_header.pack(
+            vu_magic, self.capacity, self.count, self.created))
+        self.writer.submit(self.f)
+        self.flushed = time.time()
+
+    def close(self):
+        self.flush()
+        self.writer.sync()
+        self.f.close()
+
+
+def vu_history(filename, start=None, end=None):
+    # Records with start <= time < end (wall clock seconds) from an
+    # archive, as decode_vu() plus 'time', oldest first
+    with open(filename, "rb") as f:
+        magic, capacity, count, created = vu_header.unpack(
+            f.read(vu_header.size))
+    if magic != vu_magic:
+        raise ValueError("%s is not a VU archive" % filename)
+    records = numpy.memmap(filename, vu_record, "r", vu_header.size,
+                           (capacity,))
+
+    # Up to two runs in time order, oldest first
+    if count <= capacity:
+        runs = [records[:count]]
+    else:
+        head = count % capacity
+        runs = [records[head:], records[:head]]
+
+    found = []
+    for run in runs:
+        times = run["time"]
+        first = 0 if start is None else numpy.searchsorted(times, start)
+        last = len(run) if end is None else numpy.searchsorted(times, end)
+        found.append(run[first:last])
+    found = numpy.concatenate(found)
+
+    levels = decode_vu(found["raw"])
+    levels["time"] = found["time"]
+    return levels
+
+def vu_summary(levels, step=1.0):
+    # One line per 'step' seconds: highest bars of each pair (L/R),
+    # Peek/12dB seen and the DecimalVU range
+    if not len(levels["time"]):
+        return []
+    buckets = numpy.floor(levels["time"] / step)
+    starts = numpy.flatnonzero(numpy.r_[True, buckets[1:] != buckets[:-1]])
+    left = numpy.maximum.reduceat(levels["BarL"], starts)
+    right = numpy.maximum.reduceat(levels["BarR"], starts)
+    peek = numpy.maximum.reduceat(levels["Peek"] | levels["12dB"], starts)
+    low = numpy.minimum.reduceat(levels["DecimalVU"], starts)
+    high = numpy.maximum.reduceat(levels["DecimalVU"], starts)
+
+    lines = []
+    for i, first in enumerate(starts):
+        lines.append("%s  %s  dB %d..%d" % (
+            time.strftime("%H:%M:%S",
+                          time.localtime(buckets[first] * step)),
+            " ".join("%3d/%-3d%s" % (left[i, pair], right[i, pair],
+                                     "!" if peek[i, pair] else " ")
+                     for pair in range(3)),
+            low[i], high[i]))
+    return lines
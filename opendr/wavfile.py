@@ -0,0 +1,130 @@
+import struct
+
+from .writer import pwrite
+
+# =====================================================================
+# Streamed audio straight into a WAV file. Each StreamData block carries
+# its sample offset, so blocks are written where they belong, anything
+# lost reads back as silence. The header is rewritten every 'refresh'
+# seconds of audio and on close, so a file cut short still opens, and a
+# JUNK chunk is left after it to become the ds64 chunk (RF64, EBU 3306)
+# should the file pass 4GB.
+
+stream_rates = {
+    0: 44100,
+    1: 48000,
+}
+
+header_size = 80  # RIFF, JUNK/ds64, fmt and data chunk headers
+
+class WaveWriter(object):
+    channels = 2
+    width = 2  # 16bit little endian, as streamed
+
+    def __init__(self, filename, writer=None, refresh=10):
+        # With a Writer (see writer.py) the disk writes are done on its
+        # thread, otherwise here
+        self.f = open(filename, "wb")
+        self.writer = writer
+        self.refresh = refresh
+        self.rate = None
+        self.base = None
+        self.end = 0  # frames, relative to the first block
+        self.size = 0  # bytes of audio data
+        self.updated = 0  # 'end' when the header was last written
+        self.holes = []  # [(start, end)] frames zero filled
+
+        self.blocks = 0
+        self.gaps = 0
+        self.missing = 0
+        self.late = 0
+        self.duplicates = 0
+
+    def header(self):
+        frame = self.channels * self.width
+        riff = header_size - 8 + self.size
+        if riff > 0xffffffff:
+            start = b"RF64" + struct.pack("<I", 0xffffffff) + b"WAVE" + \
+                b"ds64" + struct.pack("<IQQQI", 28, riff, self.size,
+                                      self.size // frame, 0)
+            size = 0xffffffff
+        else:
+            start = b"RIFF" + struct.pack("<I", riff) + b"WAVE" + \
+                b"JUNK" + struct.pack("<I", 28) + b"\x00" * 28
+            size = self.size
+        return start + \
+            b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.rate,
+                                  self.rate * frame, frame, self.width * 8) + \
+            b"data" + struct.pack("<I", size)
+
+    def pwrite(self, data, position):
+        if self.writer:
+            self.writer.write(self.f, position, data)
+        else:
+            pwrite(self.f, data, position)
+
+    def fill(self, start, end):
+        # Takes frames [start, end) out of the holes, returns how many
+        filled = 0
+        holes = []
+        for first, last in self.holes:
+            if last <= start or first >= end:
+                holes.append((first, last))
+                continue
+            filled += min(last, end) - max(first, start)
+            if first < start:
+                holes.append((first, start))
+            if last > end:
+                holes.append((end, last))
+        self.holes = holes
+        return filled
+
+    def write(self, rate, offset, data):
+        # 'rate' and 'offset' from the StreamData header
+        frame = self.channels * self.width
+        if self.base is None:
+            self.rate = stream_rates.get(rate, 48000)
+            self.base = offset
+            self.pwrite(self.header(), 0)
+
+        start = offset - self.base
+        if start < 0:
+            # From before the stream started here, nowhere to put it
+            self.duplicates += 1
+            return
+        if start < self.end:
+            # A block arriving late fills in (some of) a hole
+            filled = self.fill(start, start + len(data) // frame)
+            if filled:
+                self.late += 1
+                self.missing -= filled
+            else:
+                self.duplicates += 1
+        elif start > self.end:
+            self.gaps += 1
+            self.missing += start - self.end
+            self.holes.append((self.end, start))
+
+        self.pwrite(data, header_size + start * frame)
+        self.blocks += 1
+        self.end = max(self.end, start + len(data) // frame)
+        self.size = max(self.size, start * frame + len(data))
+
+        if self.end - self.updated >= self.refresh * self.rate:
+            self.updated = self.end
+            self.pwrite(self.header(), 0)
+
+    def close(self):
+        try:
+            if self.rate is not None:
+                self.pwrite(self.header(), 0)
+            if self.writer:
+                self.writer.sync()
+        finally:
+            self.f.close()
+
+    def report(self):
+        return "%d blocks, %d frames, %d gaps (%d frames zero filled), " \
+            "%d late, %d duplicates" % (self.blocks, self.end, self.gaps,
+                                        self.missing, self.late,
+                                        self.duplicates)
@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import threading
+
+# =====================================================================
+# Disk writes on their own thread, so a slow disk does not stop the
+# socket being read. Data is copied into a fixed set of preallocated
+# buffers, consecutive writes to a file are coalesced into one buffer
+# (one being filled per file, so writes to several files interleaved still
+# coalesce) and when all the buffers are queued the receive side waits
+# (backpressure). Writes and syncs may come from more than one thread.
+#
+# On an event loop the waiting would stop everything else on it, so with
+# watch() a write that finds no free buffer gets a spare one instead and
+# the receive side is paused until the thread has caught up.
+
+class Writer(object):
+    def __init__(self, slots=8, size=0x100000):
+        self.slots = slots
+        self.size = size
+        self.free = queue.Queue()
+        for i in range(slots):
+            self.free.put(bytearray(size))
+        self.full = queue.Queue()
+        self.current = {}  # f : [f, position, buffer, length]
+        self.lock = threading.RLock()  # for 'current'
+        self.error = None
+
+        self.loop = None  # see watch()
+        self.pause = None
+        self.resume = None
+        self.paused = False
+        self.spare = 0  # buffers given out past 'slots'
+        self.spares = threading.Lock()  # for 'spare' and 'paused'
+
+        self.writes = 0
+        self.packets = 0
+        self.bytes = 0
+        self.depth = 0
+        self.stalls = 0
+        self.stall = 0.0
+        self.max_stall = 0.0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.full.get()
+            try:
+                if item is None:
+                    return
+                f, position, buffer, length = item
+                if self.error is None:
+                    try:
+                        pwrite(f, memoryview(buffer)[:length], position)
+                    except Exception as e:
+                        self.error = e
+                with self.spares:
+                    if self.spare:
+                        self.spare -= 1
+                    else:
+                        self.free.put(buffer)
+                    if self.paused and not self.spare and \
+                            self.free.qsize() >= self.slots // 2:
+                        self.paused = False
+                        try:
+                            self.loop.call_soon_threadsafe(self.resume)
+                        except RuntimeError:
+                            pass  # the loop has gone
+            finally:
+                self.full.task_done()
+
+    def take(self):
+        # A free buffer, waiting for the thread if there is none, or when
+        # watched a spare one
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        # Buffers still being filled for other files are handed over, so
+        # there is something to wait for
+        self.submit()
+        if self.loop is not None:
+            with self.spares:
+                self.spare += 1
+                self.stalls += 1
+                if not self.paused:
+                    self.paused = True
+                    self.loop.call_soon_threadsafe(self.pause)
+            return bytearray(self.size)
+        start = time.perf_counter()
+        buffer = self.free.get()
+        stall = time.perf_counter() - start
+        self.stalls += 1
+        self.stall += stall
+        self.max_stall = max(self.max_stall, stall)
+        return buffer
+
+    def watch(self, loop, pause, resume):
+        # pause()/resume() are called on 'loop' when the buffers run out
+        # and when half of them are free again
+        self.loop = loop
+        self.pause = pause
+        self.resume = resume
+
+    def submit(self, f=None):
+        # Hands the buffer being filled for 'f', or for every file, over
+        with self.lock:
+            for f in [f] if f is not None else list(self.current):
+                current = self.current.pop(f, None)
+                if current:
+                    self.full.put(tuple(current))
+                    self.writes += 1
+                    self.depth = max(self.depth, self.full.qsize())
+
+    def write(self, f, position, data):
+        # Queue 'data' to be written at 'position' in (open) file 'f'
+        if self.error is not None:
+            raise self.error
+        data = memoryview(data)
+        with self.lock:
+            self.packets += 1
+            self.bytes += len(data)
+            while data:
+                current = self.current.get(f)
+                if current is None or \
+                        current[1] + current[3] != position or \
+                        current[3] == self.size:
+                    self.submit(f)
+                    current = [f, position, self.take(), 0]
+                    self.current[f] = current
+
+                length = min(len(data), self.size - current[3])
+                current[2][current[3]:current[3] + length] = data[:length]
+                current[3] += length
+                position += length
+                data = data[length:]
+
+    def flush(self):
+        # Hand over the partly filled buffers
+        self.submit()
+
+    def sync(self):
+        # Wait until everything written so far is on disk (or at least
+        # with the OS), raises any error from the thread
+        self.submit()
+        self.full.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.sync()
+        self.full.put(None)
+        self.thread.join()
+
+    def report(self):
+        return "%d packets in %d writes (%.1f per write), %.1f MB, " \
+            "queue depth %d, %d stalls (%.1f ms total, %.1f ms max)" % (
+                self.packets, self.writes,
+                self.packets / self.writes if self.writes else 0,
+                self.bytes / 1e6, self.depth, self.stalls,
+                self.stall * 1000, self.max_stall * 1000)
+
+
+def pwrite(f, data, position):
+    if hasattr(os, "pwrite"):
+        fd = f.fileno()
+        while data:
+            written = os.pwrite(fd, data, position)
+            data = data[written:]
+            position += written
+    else:
+        f.seek(position)
+        f.write(data)
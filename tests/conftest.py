@@ -0,0 +1,15 @@
+import os
+import sys
+import glob
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+def captures(pattern):
+    return sorted(glob.glob(os.path.join(root, "pcap", "*", pattern)))
+
+@pytest.fixture
+def tmpfile(tmp_path):
+    return str(tmp_path / "out")
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from conftest import captures
+from opendr.protocol import check_packet, short_packet
+from opendr.decode import parse_short
+from opendr.framing import PacketBuffer
+from opendr.replay import load_capture
+from opendr.bench import same_entries
+
+# The fast decoders against construct, for every packet in the captures,
+# both directions
+
+@pytest.mark.parametrize("filename", captures("*.pcap") + captures("*.txt"),
+                         ids=os.path.basename)
+def test_parity(filename):
+    checked = 0
+    for source in ("192.168.1.1", "192.168.1.22"):
+        buffer = PacketBuffer()
+        for timestamp, data in load_capture(filename, source):
+            buffer.feed(data)
+            for header, packet in buffer.packets():
+                checked += 1
+                assert header == check_packet.parse(packet), bytes(packet)
+                if not header.Flags.Long:
+                    assert parse_short(packet) == short_packet.parse(packet), \
+                        bytes(packet)
+                elif packet[2:5] == b"\x40\x20\x10":
+                    assert same_entries(packet), bytes(packet[:14])
+    assert checked
@@ -0,0 +1,43 @@
+import struct
+
+from opendr.framing import PacketBuffer
+
+vu = b"DR\x20\x20\x12\x00" + bytes(range(1, 9))
+
+def long_packet(body, kind=b"\x40\x20\x10"):
+    return b"DR" + kind + bytes(7) + struct.pack(">H", len(body)) + body
+
+def frame(*feeds):
+    buffer = PacketBuffer(0x100)
+    packets = []
+    for data in feeds:
+        buffer.feed(data)
+        packets.extend(bytes(packet) for header, packet in buffer.packets())
+    return buffer, packets
+
+def test_split_reads():
+    stream = vu + long_packet(bytes(300)) + vu
+    for cut in range(1, len(stream)):
+        buffer, packets = frame(stream[:cut], stream[cut:])
+        assert packets == [vu, long_packet(bytes(300)), vu]
+        assert not buffer.resyncs
+
+def test_resync_on_garbage():
+    # The trailing b"D" is kept in case it starts the magic, and skipped
+    # once the next read shows it does not
+    buffer, packets = frame(b"\x00garbageD", vu, b"DRX" + b"\xff" * 20, vu)
+    assert packets == [vu, vu]
+    assert buffer.resyncs == 3
+    assert buffer.skipped == 9 + 23
+
+def test_impossible_length():
+    bad = b"DR\x40\x20\x32" + bytes(7) + struct.pack(">H", 0xff68)
+    buffer, packets = frame(bad + vu * 2000)
+    assert len(packets) == 2000
+    assert buffer.resyncs == 1
+
+def test_truncated_long_packet():
+    packet = long_packet(bytes(40))
+    buffer, packets = frame(packet[:30] + vu + packet + vu)
+    assert packets == [vu, packet, vu]
+    assert buffer.truncated == 1
@@ -0,0 +1,33 @@
+from opendr.replay import TCPStream
+
+def payloads(ready):
+    return b"".join(payload for timestamp, payload in ready)
+
+def test_in_order():
+    stream = TCPStream()
+    assert payloads(stream.segment(0, 99, True, b"")) == b""
+    assert payloads(stream.segment(1, 100, False, b"abc")) == b"abc"
+    assert payloads(stream.segment(2, 103, False, b"def")) == b"def"
+
+def test_reordered_and_retransmitted():
+    stream = TCPStream()
+    stream.segment(0, 999, True, b"")
+    assert payloads(stream.segment(1, 1004, False, b"efgh")) == b""
+    assert payloads(stream.segment(2, 1000, False, b"abcd")) == b"abcdefgh"
+    # Retransmitted, and overlapping what was had
+    assert payloads(stream.segment(3, 1000, False, b"abcd")) == b""
+    assert payloads(stream.segment(4, 1006, False, b"ghij")) == b"ij"
+
+def test_sequence_wraps():
+    stream = TCPStream()
+    stream.segment(0, 0xfffffffd, True, b"")
+    assert payloads(stream.segment(1, 0xfffffffe, False, b"ab")) == b"ab"
+    assert payloads(stream.segment(2, 0, False, b"cd")) == b"cd"
+
+def test_missing_segment_skipped():
+    stream = TCPStream(hold=2)
+    stream.segment(0, 99, True, b"")
+    assert payloads(stream.segment(1, 110, False, b"k")) == b""
+    assert payloads(stream.segment(2, 111, False, b"l")) == b""
+    assert payloads(stream.segment(3, 112, False, b"m")) == b"klm"
+    assert stream.skipped == 10
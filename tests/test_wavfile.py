@@ -0,0 +1,50 @@
+import wave
+import struct
+
+from opendr.wavfile import WaveWriter, header_size
+
+def block(frames, value):
+    return struct.pack("<hh", value, value) * frames
+
+def samples(filename):
+    with wave.open(filename) as f:
+        data = f.readframes(f.getnframes())
+    return [value for value, in struct.iter_unpack("<hxx", data)]
+
+def test_gap_late_and_duplicate(tmpfile):
+    wav = WaveWriter(tmpfile)
+    wav.write(1, 1000, block(100, 1))
+    wav.write(1, 1200, block(100, 3))  # 100 frame gap
+    wav.write(1, 1100, block(50, 2))   # late, fills half of it
+    wav.write(1, 1100, block(50, 2))   # duplicate
+    wav.write(1, 900, block(10, 9))    # before the start
+    wav.close()
+
+    assert (wav.blocks, wav.end, wav.gaps, wav.missing, wav.late,
+            wav.duplicates) == (4, 300, 1, 50, 1, 2)
+    assert wav.holes == [(150, 200)]
+    assert samples(tmpfile) == [1] * 100 + [2] * 50 + [0] * 50 + [3] * 100
+
+def test_header_kept_current(tmpfile):
+    # Readable with its length before close
+    wav = WaveWriter(tmpfile, refresh=1)
+    wav.write(1, 0, block(48000, 1))
+    wav.write(1, 48000, block(100, 1))
+    with wave.open(tmpfile) as f:
+        assert f.getnframes() == 48000
+        assert f.getframerate() == 48000
+    wav.close()
+    with wave.open(tmpfile) as f:
+        assert f.getnframes() == 48100
+
+def test_rf64_past_4gb(tmpfile):
+    wav = WaveWriter(tmpfile)
+    wav.write(1, 0, block(1, 1))
+    wav.size = 5 << 30
+    header = wav.header()
+    wav.close()
+    assert len(header) == header_size
+    assert header[:4] == b"RF64" and header[12:16] == b"ds64"
+    assert struct.unpack_from("<IQQQ", header, 16) == (
+        28, header_size - 8 + (5 << 30), 5 << 30, (5 << 30) // 4)
+    assert header[-4:] == b"\xff\xff\xff\xff"
@@ -0,0 +1,88 @@
+import sys
+import time
+import struct
+import asyncio
+import threading
+
+import opendr.writer
+from opendr.writer import Writer
+
+def records(f, count):
+    f.seek(0)
+    data = f.read()
+    return [value for value, in struct.iter_unpack("<Q", data[:count * 8])]
+
+def test_order_over_files(tmp_path):
+    # Interleaved, overwritten and out of order writes end up as written
+    writer = Writer(slots=4, size=0x100)
+    files = [open(str(tmp_path / str(i)), "w+b") for i in range(3)]
+    for i in range(5000):
+        writer.write(files[i % 3], i // 3 * 8, struct.pack("<Q", i))
+    for f in files:
+        writer.write(f, 8, struct.pack("<Q", 7))
+    writer.close()
+    for n, f in enumerate(files):
+        expected = list(range(n, 5000, 3))
+        expected[1] = 7
+        assert records(f, len(expected)) == expected
+        f.close()
+
+def test_sync_from_another_thread(tmp_path):
+    # Thread switches as often as possible, to find any gap in the locking
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        sync_while_writing(tmp_path)
+    finally:
+        sys.setswitchinterval(interval)
+
+def sync_while_writing(tmp_path):
+    writer = Writer(slots=4, size=0x1000)
+    f = open(str(tmp_path / "out"), "w+b")
+    done = []
+
+    def sync():
+        while not done:
+            writer.sync()
+    thread = threading.Thread(target=sync)
+    thread.start()
+    for i in range(50000):
+        writer.write(f, i * 8, struct.pack("<Q", i + 1))
+    done.append(True)
+    thread.join()
+    writer.close()
+    assert records(f, 50000) == list(range(1, 50001))
+    f.close()
+
+def test_watched_does_not_block(tmp_path, monkeypatch):
+    # With a slow disk, writes on the event loop get spare buffers and
+    # reading is paused, then resumed once the thread catches up
+    pwrite = opendr.writer.pwrite
+
+    def slow(f, data, position):
+        time.sleep(0.005)
+        pwrite(f, data, position)
+    monkeypatch.setattr(opendr.writer, "pwrite", slow)
+
+    async def run():
+        events = []
+        writer = Writer(slots=4, size=0x100)
+        writer.watch(asyncio.get_running_loop(),
+                     lambda: events.append("pause"),
+                     lambda: events.append("resume"))
+        f = open(str(tmp_path / "out"), "w+b")
+        start = time.perf_counter()
+        for i in range(32):
+            writer.write(f, i * 0x100, bytes([i]) * 0x100)
+        blocked = time.perf_counter() - start
+        await asyncio.get_running_loop().run_in_executor(None, writer.close)
+        await asyncio.sleep(0)
+        f.seek(0)
+        data = f.read()
+        f.close()
+        return events, blocked, data
+
+    events, blocked, data = asyncio.run(run())
+    assert blocked < 0.05
+    assert events == ["pause", "resume"]
+    assert data == b"".join(bytes([i]) * 0x100 for i in range(32))